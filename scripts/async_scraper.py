@@ -0,0 +1,497 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+import httpx
+from scripts.rate_limiter import RateLimiter
+from scripts.rate_controller import RateController
+from scripts.html_parsers import DEFAULT_BACKEND
+from scripts.next_data import extract_listings_from_json
+from scripts.listings_scraping_with_BeautifulSoup import (
+    build_headers,
+    rotate_user_agent,
+    parse_page,
+    newest_first_url,
+)
+from scripts.dedup_store import open_global_dedup
+from scripts.response_archive import ResponseArchive
+from scripts.record_sink import RecordSink
+from scripts.crawl_checkpoints import CrawlCheckpoints
+from scripts.response_classifier import (
+    BLOCK_STATUSES, LISTINGS, EMPTY, CAPTCHA, BLOCK, REDIRECT_LOOP, ResponseClassifier,
+)
+from scripts.shard_planner import DEFAULT_CACHE_PATH, plan_shards
+from scripts.probe_cache import ProbeCache
+
+# Maximum number of requests in flight across the whole crawl
+DEFAULT_CONCURRENCY = 8
+
+# Maximum number of pages in flight (fetched but not written yet) for a single base URL
+DEFAULT_PER_URL_CONCURRENCY = 2
+
+# Maximum number of requests in flight to a single host
+DEFAULT_PER_HOST_LIMIT = 8
+
+# Number of parser processes (defaults to the number of cores)
+DEFAULT_PARSER_WORKERS = os.cpu_count() or 1
+
+# Pause applied to all fetchers when a CAPTCHA / block page is detected
+BLOCK_PAUSE_SECONDS = 90
+
+class HostLimiter:
+    """
+    Keeps one semaphore per host so that no host receives more than 'limit' concurrent requests.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphores = {}
+
+    def for_url(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.limit)
+        return self.semaphores[host]
+
+class Shard:
+    """
+    State of a single base URL: its output file, dedup store and the stop conditions of
+    'scrape_multiple_links' (repeated final_url, empty pages, pages without new offers).
+    Pages can arrive out of order from the parser stage; they are buffered in 'pending'
+    and processed strictly in page order.
+    'start_page' and 'consecutive_empty_pages' restore the progress of an interrupted crawl.
+    In incremental mode the base URL is crawled newest-first and stops at the first page whose
+    listing IDs are all known; 'total_pages' is then used to count the pages skipped.
+    """
+    def __init__(self, base_url, output_file, max_pages, per_url_concurrency, start_page=1,
+                 consecutive_empty_pages=0, incremental=False, total_pages=None):
+        self.base_url = base_url
+        self.crawl_url = newest_first_url(base_url) if incremental else base_url
+        self.output_file = output_file
+        self.max_pages = max_pages
+        self.dedup_store = None
+        self.incremental = incremental
+        self.total_pages = min(total_pages or max_pages, max_pages)
+        self.pages_skipped = 0
+
+        # Limits the pages fetched but not yet processed by the writer
+        self.window = asyncio.Semaphore(per_url_concurrency)
+        self.pending = {}
+        self.next_page = start_page
+        self.stopped = False
+
+        self.last_final_url = None
+        self.repeat_url_count = 0
+        self.consecutive_empty_pages = consecutive_empty_pages
+
+    def page_url(self, page_number):
+        return f"{self.crawl_url}&page={page_number}"
+
+    def process_page(self, page_number, cars, final_url):
+        """
+        Applies the stop conditions and dedup to a page. Returns the list of new cars.
+        Sets 'stopped' when the base URL is exhausted.
+        """
+        # Check if the final URL is the same as the previous one
+        if final_url == self.last_final_url:
+            self.repeat_url_count += 1
+            print(f"  -> final_url did not change, repeat count: {self.repeat_url_count}.")
+        else:
+            self.repeat_url_count = 0
+            self.last_final_url = final_url
+
+        if self.repeat_url_count >= 2:
+            print("[!] The same page was reached twice. Moving to the next base URL.")
+            self.stopped = True
+            return []
+
+        # If no car listings are found on the page
+        if not cars:
+            if self.consecutive_empty_pages == 0:
+                self.consecutive_empty_pages += 1
+                print("[!] Empty page – trying the next one.")
+            else:
+                print(f"[!] No more cars found at page {page_number}. Moving to next URL.")
+                self.stopped = True
+            return []
+
+        # Incremental mode: a page that lists only known IDs means the older pages are unchanged too
+        if self.incremental:
+            known_ids = self.dedup_store.known_ids(car['ID'] for car in cars)
+            if all(car['ID'] in known_ids for car in cars):
+                self.pages_skipped = max(self.total_pages - page_number, 0)
+                print(f"[*] Page {page_number} lists only known offers - skipping the remaining "
+                      f"{self.pages_skipped} pages.")
+                self.stopped = True
+                return []
+
+        # Check for uniqueness of each car listing using the digest of its unique key.
+        # The digests are committed by the writer once the records are saved.
+        new_cars = self.dedup_store.filter_new(cars)
+
+        if new_cars:
+            print(f"  -> Added {len(new_cars)} new records. Total unique records: {len(self.dedup_store)}")
+            self.consecutive_empty_pages = 0
+        else:
+            self.consecutive_empty_pages += 1
+            print(f"  -> No new unique records on this page (streak={self.consecutive_empty_pages}).")
+            if self.consecutive_empty_pages >= 3:
+                print("[!] Three consecutive pages without new offers. Moving to the next base URL.")
+                self.stopped = True
+        return new_cars
+
+class CrawlContext:
+    """
+    Resources shared by every stage of the pipeline.
+    """
+    def __init__(self, client, concurrency, per_host_limit, rate_limiter, queue_size, parser_backend,
+                 json_first, archive=None, sink=None, checkpoints=None, classifier=None, rate_controller=None):
+        self.client = client
+        self.parser_backend = parser_backend
+        self.json_first = json_first
+        self.archive = archive
+        self.sink = sink
+        self.checkpoints = checkpoints
+        self.classifier = classifier or ResponseClassifier()
+        self.rate_controller = rate_controller
+        self.crawl_semaphore = asyncio.Semaphore(concurrency)
+        self.host_limiter = HostLimiter(per_host_limit)
+        self.rate_limiter = rate_limiter
+
+        # Bounded queues between the stages provide backpressure
+        self.raw_queue = asyncio.Queue(maxsize=queue_size)
+        self.parsed_queue = asyncio.Queue(maxsize=queue_size)
+
+        # Fetchers do not send requests before this moment (set after a block page)
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def wait_if_paused(self):
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def parse_page_bytes(body, encoding, backend=DEFAULT_BACKEND, json_first=True):
+    """
+    Parser worker entry point (runs in a separate process).
+    Reads the listings from the embedded JSON straight from the raw bytes; otherwise
+    decodes the response body and extracts the listings from the DOM with 'parse_page'.
+    """
+    if json_first:
+        cars = extract_listings_from_json(body)
+        if cars is not None:
+            return cars, False
+    return parse_page(body.decode(encoding or "utf-8", errors="replace"), backend=backend, json_first=False)
+
+async def fetch_page(context, url, user_agent):
+    """
+    Downloads a single page while holding a crawl-wide and a per-host slot.
+    The request is sent only once the shared rate limiter allows it. With a response archive the
+    request is conditional, and an unchanged page (304 Not Modified) is read from the archive.
+    Returns a tuple: (body, encoding, final_url, status, headers)
+       - body -> raw response bytes, or None if the request failed
+       - encoding -> character encoding declared by the server
+       - final_url -> the actual URL after any potential redirection
+       - status -> HTTP status code (200 for a page read from the archive)
+       - headers -> response headers of a downloaded body, None if it was read from the archive
+    Block statuses (403 / 429) keep their body, so the classifier can tell a captcha from a block.
+    The response is not archived here: the fetch stage archives it once it is classified.
+    """
+    archive = context.archive
+    headers = build_headers(user_agent)
+    if archive is not None:
+        headers.update(await asyncio.to_thread(archive.conditional_headers, url))
+
+    await context.wait_if_paused()
+    async with context.crawl_semaphore, context.host_limiter.for_url(url):
+        await context.rate_limiter.acquire_async()
+        try:
+            resp = await context.client.get(url, headers=headers, timeout=10)
+        except httpx.HTTPError as e:
+            print(f"[!] Error during request {url}: {e}")
+            return None, None, url, None, None
+
+    final_url = str(resp.url)
+
+    # 429 and server errors tell the controller to slow down (captcha pages are recorded by the fetch stage)
+    if context.rate_controller is not None and resp.status_code >= 400 and resp.status_code not in BLOCK_STATUSES:
+        context.rate_controller.record(status=resp.status_code)
+
+    if resp.status_code == 304 and archive is not None:
+        cached = await asyncio.to_thread(archive.not_modified_response, url, resp.headers)
+        if cached is None:
+            print(f"[!] 304 Not Modified, but {url} is missing from the archive")
+            return None, None, final_url, resp.status_code, None
+        body, encoding, _ = cached
+        return body, encoding, final_url, 200, None
+
+    # Handle HTTP errors (block statuses are labelled by the classifier)
+    if resp.status_code == 404:
+        print(f"[!] 404 Page not found: {url}")
+        return None, None, final_url, resp.status_code, None
+    if resp.status_code >= 400 and resp.status_code not in BLOCK_STATUSES:
+        print(f"[!] HTTP error {resp.status_code} while fetching {url}")
+        return None, None, final_url, resp.status_code, None
+
+    return resp.content, resp.encoding, final_url, resp.status_code, resp.headers
+
+async def fetch_stage(context, shard, page_number):
+    """
+    Fetches one page, classifies the raw response and pushes listings pages onto the parser queue.
+    Waits when the queue is full, so fetchers never run far ahead of the parsers.
+    Failed requests and pages without listings (empty, captcha, block, redirect-loop) skip the
+    parsers and go straight to the writer with no records.
+    Only downloaded listings and empty pages are archived, so a captcha or block page served with
+    status 200 never becomes the archived copy (and the validators of the next conditional request).
+    An unexpected error (e.g. the archive disk is full) is logged and the page is passed on with no
+    records like a failed request, so the writer never waits for a page that will not come.
+    """
+    url = shard.page_url(page_number)
+    final_url = url
+    label = None
+    try:
+        user_agent = rotate_user_agent(index=page_number)
+        body, encoding, final_url, status, headers = await fetch_page(context, url, user_agent)
+
+        if body is not None:
+            label = context.classifier.classify(body, status, url, final_url)
+            if context.archive is not None and headers is not None and label in (LISTINGS, EMPTY):
+                await asyncio.to_thread(context.archive.store, url, body, encoding, final_url, headers, status)
+            if context.rate_controller is not None:
+                context.rate_controller.record(status, label)
+            if label in (CAPTCHA, BLOCK):
+                print(f"[!] {label.upper()} detected - pausing all fetchers ({BLOCK_PAUSE_SECONDS}s).")
+                context.pause(BLOCK_PAUSE_SECONDS)
+            elif label == REDIRECT_LOOP:
+                print(f"[!] Redirected from {url} to {final_url}")
+            elif label == EMPTY:
+                snippet = body[:1000].decode(encoding or "utf-8", errors="replace")
+                print("[!] No listings found on the page. HTML snippet:", snippet)
+    except Exception as e:
+        print(f"[!] Error while fetching {url}: {e}")
+        label = None
+
+    if label == LISTINGS:
+        await context.raw_queue.put((shard, page_number, body, encoding, final_url))
+    else:
+        await context.parsed_queue.put((shard, page_number, [], final_url))
+
+async def produce_pages(context, shard):
+    """
+    Schedules the page fetches of a single base URL, keeping at most 'per_url_concurrency'
+    pages between the fetch and the write stage.
+    """
+    print(f"\n[*] Start scraping from: {shard.base_url}")
+    if shard.next_page > 1:
+        print(f"  -> Resuming at page {shard.next_page}.")
+    tasks = []
+    for page_number in range(shard.next_page, shard.max_pages + 1):
+        await shard.window.acquire()
+        if shard.stopped:
+            break
+        tasks.append(asyncio.create_task(fetch_stage(context, shard, page_number)))
+    await asyncio.gather(*tasks)
+
+async def parse_stage(context, executor):
+    """
+    Takes listings pages from the fetch stage and turns them into listing records in the process pool.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await context.raw_queue.get()
+        if item is None:
+            break
+        shard, page_number, body, encoding, final_url = item
+
+        cars, blocked = await loop.run_in_executor(executor, parse_page_bytes, body, encoding,
+                                                   context.parser_backend, context.json_first)
+        if blocked:
+            print(f"[!] CAPTCHA or block detected - pausing all fetchers ({BLOCK_PAUSE_SECONDS}s).")
+            context.pause(BLOCK_PAUSE_SECONDS)
+            cars = []
+
+        await context.parsed_queue.put((shard, page_number, cars, final_url))
+
+async def write_stage(context):
+    """
+    Single writer: puts the pages of every base URL back in order, removes duplicates
+    and hands the new records of the base URL to the record sink.
+    """
+    while True:
+        item = await context.parsed_queue.get()
+        if item is None:
+            break
+        shard, page_number, cars, final_url = item
+        shard.pending[page_number] = (cars, final_url)
+
+        while shard.next_page in shard.pending:
+            cars, final_url = shard.pending.pop(shard.next_page)
+            if not shard.stopped:
+                print(f"Scraped: {shard.page_url(shard.next_page)} [page {shard.next_page}/{shard.max_pages}]")
+                new_cars = shard.process_page(shard.next_page, cars, final_url)
+                if new_cars:
+                    try:
+                        await asyncio.to_thread(context.sink.write, shard.output_file, new_cars)
+                    except Exception:
+                        shard.dedup_store.rollback()
+                        raise
+                context.checkpoints.complete_page(shard.base_url, shard.next_page, len(new_cars),
+                                                  shard.consecutive_empty_pages)
+                if shard.pages_skipped:
+                    context.checkpoints.record_skipped(shard.base_url, shard.pages_skipped)
+                if shard.stopped or shard.next_page == shard.max_pages:
+                    context.checkpoints.finish(shard.base_url)
+                    print(f"Done with base URL: {shard.base_url}")
+            shard.next_page += 1
+            shard.window.release()
+
+async def scrape_multiple_links_async(base_urls, output_dir, max_pages=500,
+                                      concurrency=DEFAULT_CONCURRENCY,
+                                      per_url_concurrency=DEFAULT_PER_URL_CONCURRENCY,
+                                      per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                                      parser_workers=DEFAULT_PARSER_WORKERS,
+                                      queue_size=None,
+                                      rate_limiter=None,
+                                      parser_backend=DEFAULT_BACKEND,
+                                      json_first=True,
+                                      archive_dir=None,
+                                      output_format="csv",
+                                      resume=True,
+                                      incremental=False,
+                                      page_counts=None,
+                                      adaptive_rate=True):
+    """
+    Async version of 'scrape_multiple_links', organised as a staged pipeline:
+       fetchers (asyncio) -> raw queue -> parsers (process pool) -> parsed queue -> writer
+    All base URLs are crawled at the same time.
+    - concurrency: maximum number of requests in flight across the whole crawl
+    - per_url_concurrency: maximum number of pages in flight for a single base URL
+    - per_host_limit: maximum number of requests in flight to a single host
+    - parser_workers: number of parser processes
+    - queue_size: capacity of the queues between the stages (defaults to 2 x concurrency)
+    - rate_limiter: RateLimiter shared by all requests (a default one is created if not provided)
+    - parser_backend: HTML parser backend used by the parser processes
+    - json_first: extract from the embedded __NEXT_DATA__ JSON, falling back to the DOM
+    - archive_dir: directory of the raw response archive (None disables archiving)
+    - output_format: 'csv', 'csv.gz' or 'parquet'
+    - resume: continue an interrupted crawl from its checkpoints (finished base URLs are skipped)
+    - incremental: crawl every base URL newest-first and stop it at the first page whose listing IDs
+      are all known already
+    - page_counts: optional {base_url: number of pages}, used to record the pages skipped in
+      incremental mode (defaults to max_pages)
+    - adaptive_rate: adjust the shared request rate to the block signals of the site (AIMD); the
+      learned rate is saved in output_dir and the next crawl starts from it
+    Each base URL still writes to its own otomoto_listings_N file; all of them share one
+    crawl-wide dedup service and one batching record sink.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"Created directory: {output_dir}")
+
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+    if queue_size is None:
+        queue_size = 2 * concurrency
+
+    # Slow down on captchas / 429 / 5xx and speed up while the responses stay clean
+    rate_controller = None
+    if adaptive_rate:
+        rate_controller = RateController(rate_limiter, state_path=os.path.join(output_dir, "crawl_rate.json"))
+
+    # One dedup service for the whole crawl, so offers listed under several base URLs are saved once
+    dedup_store = await asyncio.to_thread(open_global_dedup, output_dir)
+
+    # Progress of every base URL, so an interrupted crawl resumes where it stopped
+    checkpoints = CrawlCheckpoints(os.path.join(output_dir, "crawl_checkpoint.json"), base_urls, resume=resume)
+
+    def commit_progress():
+        # The flushed records are on disk now, so their digests and pages can be made durable
+        dedup_store.commit()
+        checkpoints.save()
+        if rate_controller is not None:
+            rate_controller.save()
+
+    # Buffer the new records and write them in batches; the dedup digests and checkpoints are saved
+    # after every flush, so a crash never marks records that were still in the buffer as seen
+    sink = RecordSink(output_format, checkpoint_path=os.path.join(output_dir, "sink_checkpoint.json"),
+                      on_flush=commit_progress)
+
+    # Keep the raw responses, so repeat crawls can send conditional requests
+    archive = await asyncio.to_thread(ResponseArchive, archive_dir) if archive_dir else None
+
+    shards = []
+    for idx, base_url in enumerate(base_urls, 1):
+        output_file = sink.output_path(os.path.join(output_dir, f"otomoto_listings_{idx}"))
+        if checkpoints.is_finished(base_url):
+            print(f"[*] Skipping finished base URL: {base_url}")
+            continue
+        state = checkpoints.get(base_url)
+        shard = Shard(base_url, output_file, max_pages, per_url_concurrency,
+                      start_page=state["last_page"] + 1,
+                      consecutive_empty_pages=state["consecutive_empty_pages"],
+                      incremental=incremental,
+                      total_pages=(page_counts or {}).get(base_url))
+        shard.dedup_store = dedup_store
+        shards.append(shard)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, follow_redirects=True) as client:
+        context = CrawlContext(client, concurrency, per_host_limit, rate_limiter, queue_size,
+                               parser_backend, json_first, archive, sink, checkpoints,
+                               rate_controller=rate_controller)
+        with ProcessPoolExecutor(max_workers=parser_workers) as executor:
+            parsers = [asyncio.create_task(parse_stage(context, executor)) for _ in range(parser_workers)]
+            writer = asyncio.create_task(write_stage(context))
+
+            await asyncio.gather(*(produce_pages(context, shard) for shard in shards))
+
+            # Shut the stages down in order once every fetch has been queued
+            for _ in parsers:
+                await context.raw_queue.put(None)
+            await asyncio.gather(*parsers)
+            await context.parsed_queue.put(None)
+            await writer
+
+    await asyncio.to_thread(sink.close)
+    sink.report()
+    checkpoints.save()
+    checkpoints.report()
+    dedup_store.close()
+    dedup_store.report()
+    if archive is not None:
+        await asyncio.to_thread(archive.evict)
+        archive.report()
+        archive.close()
+    context.classifier.report()
+    if rate_controller is not None:
+        rate_controller.save()
+        rate_controller.report()
+
+    rate_limiter.report()
+    print("All base URLs have been processed.")
+
+def run_async_scraper(base_urls, output_dir, max_pages=500, **options):
+    """
+    Synchronous entry point for 'scrape_multiple_links_async'.
+    """
+    asyncio.run(scrape_multiple_links_async(base_urls, output_dir, max_pages, **options))
+
+if __name__ == "__main__":
+    # Split the search into shards that fit under the page cap
+    shards = plan_shards(cache=ProbeCache(DEFAULT_CACHE_PATH))
+
+    run_async_scraper(
+        [shard.url for shard in shards],
+        output_dir="data/otomoto_listings",
+        max_pages=500,
+        concurrency=DEFAULT_CONCURRENCY,
+        per_url_concurrency=DEFAULT_PER_URL_CONCURRENCY,
+        per_host_limit=DEFAULT_PER_HOST_LIMIT,
+        parser_workers=DEFAULT_PARSER_WORKERS,
+        archive_dir="data/otomoto_archive",
+        # Daily refresh: set to True to stop every base URL at the first page of known listings
+        incremental=False,
+        page_counts={shard.url: shard.pages for shard in shards},
+    )
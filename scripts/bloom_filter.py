@@ -0,0 +1,157 @@
+import os
+import math
+import struct
+
+MASK_64 = (1 << 64) - 1
+
+def optimal_num_bits(capacity, error_rate):
+    """
+    Number of bits a Bloom filter needs to hold 'capacity' items at 'error_rate'.
+    """
+    return max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over 64-bit integer digests (see scripts.dedup_store.key_digest).
+    The k bit positions are derived from the digest with double hashing, so no extra hashing is needed.
+    """
+    def __init__(self, capacity, error_rate, num_bits=None, num_hashes=None, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = num_bits or optimal_num_bits(capacity, error_rate)
+        self.num_hashes = num_hashes or max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, digest):
+        value = digest & MASK_64
+        h1 = value & 0xFFFFFFFF
+        h2 = (value >> 32) | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, digest):
+        bits = self.bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def estimated_error_rate(self):
+        """
+        False-positive probability for the number of items added so far.
+        """
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+class ScalableBloomFilter:
+    """
+    Bloom filter that grows by adding larger filters with a tighter error rate, so the combined
+    false-positive rate stays close to 'error_rate' however many items are added.
+    - initial_capacity: items the first filter is sized for
+    - error_rate: target false-positive rate of the whole filter
+    - growth: capacity multiplier of every new filter
+    - tightening: error rate multiplier of every new filter
+    - max_bytes: memory cap; once reached no new filters are added and the last one keeps
+      filling up (its false-positive rate then rises, which 'estimated_error_rate' reports)
+    """
+    HEADER = struct.Struct("<4sI")
+    FILTER_HEADER = struct.Struct("<QdQQIQ")
+
+    def __init__(self, initial_capacity=1_000_000, error_rate=0.001, growth=2, tightening=0.5,
+                 max_bytes=256 * 1024 * 1024):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.max_bytes = max_bytes
+        self.filters = []
+        self.at_memory_cap = False
+
+    def _add_filter(self):
+        """
+        Appends the next, larger filter. Returns False if it would exceed 'max_bytes'.
+        """
+        index = len(self.filters)
+        capacity = self.initial_capacity * (self.growth ** index)
+        # Error rates form a geometric series that sums to at most 'error_rate'
+        error_rate = self.error_rate * (1 - self.tightening) * (self.tightening ** index)
+        if self.filters and self.memory_bytes() + optimal_num_bits(capacity, error_rate) / 8 > self.max_bytes:
+            self.at_memory_cap = True
+            return False
+        self.filters.append(BloomFilter(capacity, error_rate))
+        return True
+
+    def __contains__(self, digest):
+        return any(digest in bloom for bloom in reversed(self.filters))
+
+    def add(self, digest):
+        if not self.filters or (self.filters[-1].is_full() and not self.at_memory_cap):
+            self._add_filter()
+        self.filters[-1].add(digest)
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    def memory_bytes(self):
+        return sum(bloom.memory_bytes() for bloom in self.filters)
+
+    def estimated_error_rate(self):
+        """
+        Combined false-positive probability: a lookup is a false positive if any filter reports one.
+        """
+        miss = 1.0
+        for bloom in self.filters:
+            miss *= 1 - bloom.estimated_error_rate()
+        return 1 - miss
+
+    def save(self, path, stored_count):
+        """
+        Writes the filter to 'path'. 'stored_count' records how many items the backing store held,
+        so a stale snapshot can be detected on load. The snapshot is written and synced under a
+        temporary name, then renamed over 'path', so a crash never leaves a truncated filter.
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER.pack(b"SBF1", len(self.filters)))
+            f.write(struct.pack("<Q", stored_count))
+            for bloom in self.filters:
+                f.write(self.FILTER_HEADER.pack(bloom.capacity, bloom.error_rate, bloom.num_bits,
+                                                bloom.count, bloom.num_hashes, len(bloom.bits)))
+                f.write(bloom.bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """
+        Replaces the filters with the ones saved in 'path'. Returns the 'stored_count' of the snapshot,
+        or None (keeping the current filters) if a bit array is shorter than its header says or does
+        not fit its number of bits - the snapshot is truncated and has to be rebuilt.
+        """
+        with open(path, "rb") as f:
+            magic, num_filters = self.HEADER.unpack(f.read(self.HEADER.size))
+            if magic != b"SBF1":
+                raise ValueError(f"{path} is not a Bloom filter snapshot")
+            (stored_count,) = struct.unpack("<Q", f.read(8))
+            filters = []
+            for _ in range(num_filters):
+                capacity, error_rate, num_bits, count, num_hashes, size = self.FILTER_HEADER.unpack(
+                    f.read(self.FILTER_HEADER.size))
+                bits = bytearray(f.read(size))
+                if len(bits) != size or size != (num_bits + 7) // 8:
+                    return None
+                filters.append(BloomFilter(capacity, error_rate, num_bits, num_hashes, bits, count))
+        self.filters = filters
+        return stored_count
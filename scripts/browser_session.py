@@ -0,0 +1,142 @@
+import time
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+# Page opened to get past the consent banner and collect the session cookies
+BOOTSTRAP_URL = "https://www.otomoto.pl/osobowe?search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true"
+
+# Cookie consent button of the OneTrust banner
+CONSENT_BUTTON_ID = "onetrust-accept-btn-handler"
+
+# A bootstrapped session is refreshed after this long, even without block signals
+DEFAULT_MAX_AGE_MINUTES = 30
+
+# Cookies whose expiry ends the handed-over session (matched in the lowercased name): the consent
+# cookies of the OneTrust banner and the site's session cookies. Short-lived analytics and ad
+# cookies do not make the session expire.
+SESSION_COOKIE_MARKERS = ("optanon", "consent", "sess")
+
+def create_headless_driver():
+    """
+    Starts a headless Chrome for bootstrapping sessions.
+    """
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1920,1080")
+    return webdriver.Chrome(options=options)
+
+def accept_cookies(driver, timeout=15):
+    """
+    Clicks the cookie consent button if the banner is shown. Returns True if it was clicked.
+    """
+    try:
+        button = WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable((By.ID, CONSENT_BUTTON_ID))
+        )
+        button.click()
+        return True
+    except Exception as e:
+        print(f"Cookie acceptance button not found or not clickable: {e}")
+        # It might be that cookies are already accepted or not displayed
+        return False
+
+def desktop_user_agent(user_agent):
+    """
+    Returns the User-Agent of headless Chrome as the regular desktop browser reports it
+    ('HeadlessChrome/...' -> 'Chrome/...'), so the HTTP client does not announce a headless browser.
+    """
+    return user_agent.replace("HeadlessChrome", "Chrome")
+
+def is_session_cookie(cookie):
+    name = cookie.get("name", "").lower()
+    return any(marker in name for marker in SESSION_COOKIE_MARKERS)
+
+class BrowserSession:
+    """
+    Hybrid mode: a browser is started only to get past the consent banner; its cookies and
+    User-Agent are then moved into a plain HTTP client (requests.Session or httpx.Client), which
+    does the bulk pagination. The browser is closed right after the handoff and started again
+    only when the session expires.
+    - create_driver: function returning a new webdriver (headless Chrome by default)
+    - bootstrap_url: page opened to collect the cookies
+    - max_age_minutes: age after which the session is bootstrapped again
+    A session also expires when one of its session / consent cookies does, or when the site answers
+    with a captcha / block page (see 'expire'). The browser's User-Agent is handed over without the
+    'Headless' marker, and the bootstrap page is already loaded with that User-Agent.
+    """
+    def __init__(self, create_driver=create_headless_driver, bootstrap_url=BOOTSTRAP_URL,
+                 max_age_minutes=DEFAULT_MAX_AGE_MINUTES):
+        self.create_driver = create_driver
+        self.bootstrap_url = bootstrap_url
+        self.max_age_seconds = max_age_minutes * 60
+        self.cookies = []
+        self.user_agent = None
+        self.bootstrapped_at = None
+        self.expires_at = None
+
+        # Statistics
+        self.bootstraps = 0
+        self.bootstrap_seconds = 0.0
+
+    def bootstrap(self):
+        """
+        Opens the bootstrap page in a fresh browser, accepts the cookies and keeps the session.
+        """
+        start = time.perf_counter()
+        driver = self.create_driver()
+        try:
+            user_agent = desktop_user_agent(driver.execute_script("return navigator.userAgent"))
+            try:
+                # The cookies are issued to the same User-Agent the HTTP client will send
+                driver.execute_cdp_cmd("Network.setUserAgentOverride", {"userAgent": user_agent})
+            except Exception as e:
+                print(f"[!] Could not override the browser's User-Agent: {e}")
+            driver.get(self.bootstrap_url)
+            if accept_cookies(driver):
+                # Let the consent cookies be written
+                time.sleep(2)
+            self.cookies = driver.get_cookies()
+            self.user_agent = user_agent
+        finally:
+            driver.quit()
+
+        self.bootstrapped_at = time.time()
+        cookie_expiries = [cookie["expiry"] for cookie in self.cookies
+                           if cookie.get("expiry") and is_session_cookie(cookie)]
+        self.expires_at = min([self.bootstrapped_at + self.max_age_seconds] + cookie_expiries)
+        self.bootstraps += 1
+        self.bootstrap_seconds += time.perf_counter() - start
+        print(f"[*] Browser session bootstrapped: {len(self.cookies)} cookies handed to the HTTP client.")
+
+    def is_expired(self):
+        return self.expires_at is None or time.time() >= self.expires_at
+
+    def expire(self):
+        """
+        Marks the session as expired (e.g. after a captcha), so the next 'apply' bootstraps again.
+        """
+        self.expires_at = None
+
+    def apply(self, client):
+        """
+        Copies the cookies and User-Agent of the session into 'client' (requests.Session or
+        httpx.Client), bootstrapping first if the session expired. Returns the User-Agent, which
+        has to be sent with every request for the cookies to stay valid.
+        """
+        if not self.is_expired():
+            return self.user_agent
+        self.bootstrap()
+        client.cookies.clear()
+        for cookie in self.cookies:
+            client.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""),
+                               path=cookie.get("path", "/"))
+        client.headers["User-Agent"] = self.user_agent
+        return self.user_agent
+
+    def report(self):
+        print(f"[*] Browser session: {self.bootstraps} bootstraps, {self.bootstrap_seconds:.1f}s in the browser.")
@@ -5,14 +5,33 @@ from dotenv import load_dotenv
 
 load_dotenv(dotenv_path="database.env")
 
+# SQL Server ODBC drivers, most recent first ("SQL Server" is the legacy Windows driver)
+SQL_SERVER_DRIVERS = ["ODBC Driver 18 for SQL Server", "ODBC Driver 17 for SQL Server", "SQL Server"]
+
+def get_driver():
+    """
+    Returns the ODBC driver named in DB_DRIVER, or the most recent SQL Server driver installed.
+    """
+    driver = os.getenv("DB_DRIVER")
+    if driver:
+        return driver
+    installed = pyodbc.drivers()
+    for name in SQL_SERVER_DRIVERS:
+        if name in installed:
+            return name
+    return "SQL Server"
+
 def get_connection():
     server = os.getenv("DB_SERVER")
     database = os.getenv("DB_NAME")
     username = os.getenv("DB_USER")
     password = os.getenv("DB_PASSWORD")
-    
+    # ODBC Driver 18 encrypts by default; DB_TRUST_CERT=yes accepts a self-signed server certificate
+    trust_certificate = os.getenv("DB_TRUST_CERT", "no")
+
     conn = pyodbc.connect(
-        f'DRIVER={{SQL Server}};SERVER={server};DATABASE={database};UID={username};PWD={password}'
+        f'DRIVER={{{get_driver()}}};SERVER={server};DATABASE={database};UID={username};PWD={password};'
+        f'TrustServerCertificate={trust_certificate}'
     )
     return conn
 
@@ -0,0 +1,92 @@
+import time
+import threading
+from scripts.record_sink import read_json, write_json_atomic
+
+# Checkpoints older than this belong to an abandoned crawl and are not resumed
+DEFAULT_MAX_AGE_HOURS = 24
+
+class CrawlCheckpoints:
+    """
+    Progress of every base URL of a crawl, so an interrupted run resumes where it stopped.
+    For each base URL it keeps the last completed page, when it was fetched, the number of new
+    records it produced, the current streak of pages without new records, whether the base URL
+    is finished and, in incremental mode, how many pages were skipped after reaching known listings.
+    - path: JSON file of the checkpoints (written atomically by 'save')
+    - base_urls: base URLs of this crawl
+    - resume: continue the crawl recorded in 'path' (False always starts from page 1)
+    - max_age_hours: a recorded crawl older than this is started again
+    A crawl whose base URLs are all finished is complete, so the next run starts a new one.
+    'save' should only be called once the records of the completed pages are on disk (the scrapers
+    call it after every flush of the record sink).
+    """
+    def __init__(self, path, base_urls, resume=True, max_age_hours=DEFAULT_MAX_AGE_HOURS):
+        self.path = path
+        self.lock = threading.Lock()
+        data = read_json(path) if resume else None
+
+        if data is not None:
+            shards = data.get("shards", {})
+            age_hours = (time.time() - data.get("started_at", 0)) / 3600
+            if age_hours > max_age_hours:
+                print(f"[*] Checkpoints in {path} are {age_hours:.0f}h old - starting a new crawl.")
+                data = None
+            elif all(shards.get(base_url, {}).get("finished") for base_url in base_urls):
+                print(f"[*] The crawl recorded in {path} is complete - starting a new crawl.")
+                data = None
+
+        if data is None:
+            data = {"started_at": time.time(), "shards": {}}
+        self.data = data
+        for base_url in base_urls:
+            self.data["shards"].setdefault(base_url, {
+                "last_page": 0,
+                "fetched_at": None,
+                "new_records": 0,
+                "consecutive_empty_pages": 0,
+                "finished": False,
+                "pages_skipped": 0,
+            })
+
+    def get(self, base_url):
+        return self.data["shards"][base_url]
+
+    def start_page(self, base_url):
+        """
+        Returns the first page still to be scraped for 'base_url'.
+        """
+        return self.get(base_url)["last_page"] + 1
+
+    def is_finished(self, base_url):
+        return self.get(base_url)["finished"]
+
+    def complete_page(self, base_url, page_number, new_records, consecutive_empty_pages):
+        with self.lock:
+            state = self.get(base_url)
+            state["last_page"] = page_number
+            state["fetched_at"] = time.time()
+            state["new_records"] += new_records
+            state["consecutive_empty_pages"] = consecutive_empty_pages
+
+    def record_skipped(self, base_url, pages_skipped):
+        with self.lock:
+            self.get(base_url)["pages_skipped"] = pages_skipped
+
+    def finish(self, base_url):
+        with self.lock:
+            self.get(base_url)["finished"] = True
+
+    def save(self):
+        with self.lock:
+            self.data["updated_at"] = time.time()
+            write_json_atomic(self.path, self.data)
+
+    def report(self):
+        shards = self.data["shards"].values()
+        finished = sum(1 for state in shards if state["finished"])
+        pages = sum(state["last_page"] for state in shards)
+        records = sum(state["new_records"] for state in shards)
+        skipped = sum(state.get("pages_skipped", 0) for state in shards)
+        print(f"[*] Checkpoints: {finished}/{len(shards)} base URLs finished, {pages} pages, "
+              f"{records} new records in this crawl.")
+        if skipped:
+            print(f"    Incremental mode skipped {skipped} pages of unchanged listings.")
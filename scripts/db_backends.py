@@ -0,0 +1,414 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+# Backend used when DB_BACKEND is not set
+DEFAULT_BACKEND = "sqlserver"
+
+# Connections kept open by a backend's pool
+DEFAULT_POOL_SIZE = 4
+
+# Columns of the 'cars' table (without the surrogate key) and their types, used by the local engines.
+# SQL Server creates the same tables from sql/create_tables.sql.
+CARS_SCHEMA = [
+    ("Make", "VARCHAR(100)"),
+    ("Model", "VARCHAR(100)"),
+    ("Engine_capacity", "FLOAT"),
+    ("Power_HP", "FLOAT"),
+    ("Mileage_in_km", "FLOAT"),
+    ("Fuel_Type", "VARCHAR(100)"),
+    ("Gearbox", "VARCHAR(100)"),
+    ("Year", "INT"),
+    ("City", "VARCHAR(255)"),
+    ("Province", "VARCHAR(255)"),
+    ("Seller_Type", "VARCHAR(100)"),
+    ("Price", "FLOAT"),
+    ("Currency", "VARCHAR(10)"),
+    ("Otomoto_ID", "BIGINT"),
+    ("Otomoto_Indicator", "VARCHAR(100)"),
+    ("Title", "VARCHAR(255)"),
+    ("Link", "VARCHAR(255)"),
+    ("Description", "TEXT"),
+    ("Scraping_Date", "TIMESTAMP"),
+]
+
+# Key of the upsert, and the columns that do not make a listing "changed" on their own
+# (every load has a new scraping date)
+UPSERT_KEY = "Otomoto_ID"
+UNTRACKED_COLUMNS = {"Otomoto_ID", "Scraping_Date"}
+
+class ConnectionPool:
+    """
+    Keeps up to 'size' open connections made by 'connect' and lends them out with 'connection()'.
+    A connection is checked with 'SELECT 1' before it is lent and replaced if it is broken;
+    a transaction left open by the borrower is rolled back when the connection is returned.
+    """
+    def __init__(self, connect, size=DEFAULT_POOL_SIZE):
+        self.connect = connect
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+            if not can_create:
+                conn = self.idle.get()
+            else:
+                return self._connect_slot()
+        try:
+            conn.cursor().execute("SELECT 1").fetchall()
+            return conn
+        except Exception:
+            # Broken connection (e.g. the server closed it) - open a new one in its place
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return self._connect_slot()
+
+    def _connect_slot(self):
+        """
+        Opens a connection for a slot counted in 'created'. If that fails the slot is given back,
+        so a later call can try again once the server is reachable.
+        """
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+def columns_sql(columns):
+    return ", ".join(columns)
+
+def ranked_staging_sql(columns, staging_table):
+    """
+    Rows of the staging table that have an Otomoto_ID, keeping the most recent row of every listing.
+    """
+    return (
+        f"SELECT {columns_sql(columns)} FROM ("
+        f"SELECT *, ROW_NUMBER() OVER (PARTITION BY {UPSERT_KEY} ORDER BY Scraping_Date DESC) AS row_rank "
+        f"FROM {staging_table} WHERE {UPSERT_KEY} IS NOT NULL"
+        f") AS ranked WHERE row_rank = 1"
+    )
+
+class SqlServerBackend:
+    """
+    SQL Server through pyodbc (the original database). The ODBC driver is read from DB_DRIVER or
+    picked from the installed drivers, so the loader also runs with Microsoft's Linux driver.
+    Rows are sent with 'fast_executemany'; the upsert is a single MERGE.
+    """
+    name = "sqlserver"
+    schema_path = "sql/create_tables.sql"
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        import pyodbc
+        from scripts.connect_sql import get_connection
+        self.pyodbc = pyodbc
+        self.pool = ConnectionPool(get_connection, pool_size)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def begin(self, conn):
+        # pyodbc connections are not in autocommit mode, a transaction is always open
+        pass
+
+    def create_schema(self, conn):
+        # Read the SQL script from the file
+        with open(self.schema_path, "r") as file:
+            sql_script = file.read()
+        cursor = conn.cursor()
+        for statement in sql_script.split("GO"):  # SQL Server uses "GO" as a batch separator
+            if statement.strip():
+                cursor.execute(statement)
+        conn.commit()
+
+    def insert_rows(self, conn, query, rows):
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany(query, rows)
+
+    def truncate(self, conn, table):
+        conn.cursor().execute(f"TRUNCATE TABLE {table}")
+
+    def create_scratch_table(self, conn, name, like="cars"):
+        """
+        Creates an empty temporary copy of 'like' and returns its name.
+        """
+        conn.cursor().execute(f"SELECT TOP 0 * INTO #{name} FROM {like}")
+        return f"#{name}"
+
+    def drop_table(self, conn, table):
+        conn.cursor().execute(f"DROP TABLE {table}")
+
+    def upsert(self, conn, columns, table, staging_table):
+        """
+        Merges the staging table into 'table' (see 'merge_query'). Returns (inserted, updated).
+        """
+        cursor = conn.cursor()
+        cursor.execute(self.merge_query(columns, table, staging_table))
+        actions = [row[0] for row in cursor.fetchall()]
+        return actions.count("INSERT"), actions.count("UPDATE")
+
+    @staticmethod
+    def merge_query(columns, table, staging_table):
+        """
+        Returns the set-based upsert of the staging table into 'table', keyed on Otomoto_ID:
+        new listings are inserted, listings whose tracked columns changed (e.g. the price) are updated
+        in place and unchanged listings are not touched. The EXCEPT comparison treats NULLs as equal.
+        Rows without an Otomoto_ID cannot be matched and are left out; a listing staged several times
+        keeps its most recent row. The OUTPUT clause returns one row per action (INSERT / UPDATE).
+        """
+        tracked = [column for column in columns if column not in UNTRACKED_COLUMNS]
+        return (
+            f"MERGE {table} WITH (HOLDLOCK) AS target "
+            f"USING ({ranked_staging_sql(columns, staging_table)}) AS source "
+            f"ON target.{UPSERT_KEY} = source.{UPSERT_KEY} "
+            f"WHEN MATCHED AND EXISTS ("
+            f"SELECT {', '.join('source.' + column for column in tracked)} "
+            f"EXCEPT SELECT {', '.join('target.' + column for column in tracked)}"
+            f") THEN UPDATE SET {', '.join(f'{column} = source.{column}' for column in columns if column != UPSERT_KEY)} "
+            f"WHEN NOT MATCHED BY TARGET THEN INSERT ({columns_sql(columns)}) "
+            f"VALUES ({', '.join('source.' + column for column in columns)}) "
+            f"OUTPUT $action;"
+        )
+
+    def close(self):
+        self.pool.close()
+
+class LocalBackend:
+    """
+    Shared part of the embedded engines: the schema is created from CARS_SCHEMA and the upsert is an
+    INSERT ... ON CONFLICT on the unique Otomoto_ID, preceded by two counts of what it will change.
+    """
+    # Null-safe "differs" operator of the engine
+    distinct_operator = "IS DISTINCT FROM"
+
+    # Surrogate key column of the 'cars' table
+    id_column = "id INTEGER PRIMARY KEY"
+
+    # Statements run before the tables are created (e.g. sequences)
+    schema_preamble = []
+
+    # WHERE clause of the unique index on Otomoto_ID
+    unique_index_filter = ""
+
+    # Declare Otomoto_ID UNIQUE in the table instead of creating a separate unique index
+    inline_unique_key = False
+
+    def table_sql(self, table, with_id):
+        columns = []
+        for name, sql_type in CARS_SCHEMA:
+            if with_id and name == UPSERT_KEY and self.inline_unique_key:
+                sql_type += " UNIQUE"
+            columns.append(f"{name} {sql_type}")
+        if with_id:
+            columns.insert(0, self.id_column)
+        return f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})"
+
+    def create_schema(self, conn):
+        cursor = conn.cursor()
+        for statement in self.schema_preamble:
+            cursor.execute(statement)
+        cursor.execute(self.table_sql("cars", with_id=True))
+        if not self.inline_unique_key:
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS UX_cars_Otomoto_ID ON cars ({UPSERT_KEY})"
+                           f"{self.unique_index_filter}")
+        cursor.execute(self.table_sql("cars_staging", with_id=False))
+        conn.commit()
+
+    def truncate(self, conn, table):
+        conn.cursor().execute(f"DELETE FROM {table}")
+
+    def create_scratch_table(self, conn, name, like="cars"):
+        conn.cursor().execute(f"CREATE TEMP TABLE {name} AS SELECT * FROM {like} LIMIT 0")
+        return name
+
+    def drop_table(self, conn, table):
+        conn.cursor().execute(f"DROP TABLE {table}")
+
+    def upsert(self, conn, columns, table, staging_table):
+        """
+        Upserts the staging table into 'table' on Otomoto_ID. Returns (inserted, updated).
+        """
+        tracked = [column for column in columns if column not in UNTRACKED_COLUMNS]
+        changed = " OR ".join(f"{table}.{column} {self.distinct_operator} excluded.{column}" for column in tracked)
+        source = ranked_staging_sql(columns, staging_table)
+        cursor = conn.cursor()
+
+        inserted = cursor.execute(
+            f"SELECT COUNT(*) FROM ({source}) AS source "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {table}.{UPSERT_KEY} = source.{UPSERT_KEY})"
+        ).fetchone()[0]
+        updated = cursor.execute(
+            f"SELECT COUNT(*) FROM ({source}) AS excluded JOIN {table} "
+            f"ON {table}.{UPSERT_KEY} = excluded.{UPSERT_KEY} WHERE {changed}"
+        ).fetchone()[0]
+
+        cursor.execute(
+            f"INSERT INTO {table} ({columns_sql(columns)}) SELECT {columns_sql(columns)} FROM ({source}) AS source "
+            f"WHERE true "
+            f"ON CONFLICT ({UPSERT_KEY}){self.unique_index_filter} DO UPDATE SET "
+            f"{', '.join(f'{column} = excluded.{column}' for column in columns if column != UPSERT_KEY)} "
+            f"WHERE {changed}"
+        )
+        return inserted, updated
+
+class SQLiteBackend(LocalBackend):
+    """
+    Local SQLite file (standard library), for running and tuning the ETL without a server.
+    The database is in WAL mode, so readers are not blocked while a load is running.
+    """
+    name = "sqlite"
+    distinct_operator = "IS NOT"
+    id_column = "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    unique_index_filter = f" WHERE {UPSERT_KEY} IS NOT NULL"
+
+    def __init__(self, path=None, pool_size=DEFAULT_POOL_SIZE):
+        import sqlite3
+        self.sqlite3 = sqlite3
+        self.path = path or os.getenv("DB_PATH", "data/car_data.sqlite")
+        self.pool = ConnectionPool(self._connect, pool_size)
+
+    def _connect(self):
+        conn = self.sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def connection(self):
+        return self.pool.connection()
+
+    def begin(self, conn):
+        # sqlite3 opens a transaction implicitly before the first write
+        pass
+
+    def insert_rows(self, conn, query, rows):
+        conn.executemany(query, rows)
+
+    def close(self):
+        self.pool.close()
+
+class DuckDBConnection:
+    """
+    A pooled DuckDB connection whose 'cursor()' returns the connection itself. On DuckDB 'cursor()'
+    opens a duplicate connection with its own (autocommit) transaction, so statements run through
+    it would escape the transaction started by 'DuckDBBackend.begin'.
+    Everything else is delegated to the wrapped connection.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=None):
+        if params is None:
+            self.connection.execute(query)
+        else:
+            self.connection.execute(query, params)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+class DuckDBBackend(LocalBackend):
+    """
+    Local DuckDB file (requires 'duckdb'), a columnar engine suited to bulk loads and analytics.
+    Every pooled connection is a cursor of one database connection (a DuckDB file accepts a single
+    writing process), wrapped in DuckDBConnection so all of its statements share one transaction.
+    Rows are inserted through a registered DataFrame instead of executemany, which DuckDB runs
+    row by row.
+    """
+    name = "duckdb"
+    id_column = "id BIGINT PRIMARY KEY DEFAULT nextval('cars_id_seq')"
+    schema_preamble = ["CREATE SEQUENCE IF NOT EXISTS cars_id_seq"]
+    inline_unique_key = True
+
+    def __init__(self, path=None, pool_size=DEFAULT_POOL_SIZE):
+        import duckdb
+        import pandas as pd
+        self.pd = pd
+        self.path = path or os.getenv("DB_PATH", "data/car_data.duckdb")
+        self.database = duckdb.connect(self.path)
+        self.pool = ConnectionPool(lambda: DuckDBConnection(self.database.cursor()), pool_size)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def begin(self, conn):
+        # DuckDB connections autocommit until a transaction is started explicitly
+        conn.begin()
+
+    def create_scratch_table(self, conn, name, like="cars"):
+        """
+        Creates an empty copy of 'like' as a regular table (a temporary table would only be visible
+        to one pooled connection); the caller drops it with 'drop_table'.
+        """
+        cursor = conn.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+        cursor.execute(f"CREATE TABLE {name} AS SELECT * FROM {like} LIMIT 0")
+        return name
+
+    def insert_rows(self, conn, query, rows):
+        # 'query' is "INSERT INTO <table> (<columns>) VALUES (...)"; the rows are inserted as a frame
+        head = query.split(" VALUES ", 1)[0]
+        columns = head[head.index("(") + 1:head.rindex(")")].split(", ")
+        batch = self.pd.DataFrame.from_records(rows, columns=columns)
+        conn.register("insert_batch", batch)
+        try:
+            conn.execute(f"{head} SELECT * FROM insert_batch")
+        finally:
+            conn.unregister("insert_batch")
+
+    def close(self):
+        self.pool.close()
+        self.database.close()
+
+BACKENDS = {
+    SqlServerBackend.name: SqlServerBackend,
+    SQLiteBackend.name: SQLiteBackend,
+    DuckDBBackend.name: DuckDBBackend,
+}
+
+def get_backend(name=None, **options):
+    """
+    Returns a new database backend: 'sqlserver', 'sqlite' or 'duckdb' (DB_BACKEND by default).
+    Raises ImportError if the library behind the backend is not installed.
+    """
+    name = name or os.getenv("DB_BACKEND") or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown database backend '{name}'. Available: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
@@ -0,0 +1,315 @@
+import os
+import csv
+import glob
+import struct
+import sqlite3
+import hashlib
+import threading
+from scripts.bloom_filter import ScalableBloomFilter
+
+# Fields that identify a car offer (same as 'create_unique_key')
+KEY_FIELDS = ['Title', 'Description', 'Mileage', 'Fuel Type', 'Gearbox', 'Year', 'Location', 'Seller Type', 'Price']
+
+def unique_key(car):
+    """
+    Builds the '|'-joined key of a car offer from KEY_FIELDS.
+    """
+    return "|".join(str(car.get(field, '')).strip() for field in KEY_FIELDS)
+
+def key_digest(key):
+    """
+    Returns the 64-bit digest of a unique key as a signed integer (fits SQLite's INTEGER PRIMARY KEY).
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def listing_id_key(listing_id):
+    """
+    Returns the integer key of a listing ID ('6134882960' -> 6134882960; other IDs are hashed),
+    or None if the record has no ID.
+    """
+    listing_id = str(listing_id).strip()
+    if not listing_id or listing_id == "N/A":
+        return None
+    if listing_id.isdigit() and len(listing_id) <= 18:
+        return int(listing_id)
+    return key_digest(listing_id)
+
+class DedupStore:
+    """
+    Persistent set of offer digests stored in SQLite.
+    Opening the store does not read its contents, so startup time does not depend on its size.
+    New digests are inserted inside a transaction that is made durable by 'commit' - call it
+    after the records have been written, so a crash never marks unsaved records as seen.
+    The listing IDs of every record passed to 'filter_new' are kept as well ('known_ids'), for the
+    incremental crawl mode.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen (digest INTEGER PRIMARY KEY)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen_ids (listing_id INTEGER PRIMARY KEY)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('count', 0)")
+        self.connection.commit()
+        self.count = self.connection.execute("SELECT value FROM meta WHERE name = 'count'").fetchone()[0]
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.contains_digest(key_digest(key))
+
+    def contains_digest(self, digest):
+        row = self.connection.execute("SELECT 1 FROM seen WHERE digest = ?", (digest,)).fetchone()
+        return row is not None
+
+    def iter_digests(self, batch_size=100000):
+        """
+        Yields every stored digest (used to rebuild in-memory filters).
+        """
+        cursor = self.connection.execute("SELECT digest FROM seen")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for (digest,) in rows:
+                yield digest
+
+    def add_digests(self, digests):
+        """
+        Inserts digests into the current transaction. Returns a list of booleans, True for digests
+        that were not in the store yet.
+        """
+        cursor = self.connection.cursor()
+        added = []
+        for digest in digests:
+            cursor.execute("INSERT OR IGNORE INTO seen (digest) VALUES (?)", (digest,))
+            added.append(cursor.rowcount == 1)
+        new_count = sum(added)
+        if new_count:
+            self.count += new_count
+            cursor.execute("UPDATE meta SET value = ? WHERE name = 'count'", (self.count,))
+        return added
+
+    def add_ids(self, listing_ids):
+        """
+        Records listing IDs in the current transaction.
+        """
+        keys = [(key,) for key in map(listing_id_key, listing_ids) if key is not None]
+        self.connection.executemany("INSERT OR IGNORE INTO seen_ids (listing_id) VALUES (?)", keys)
+
+    def known_ids(self, listing_ids):
+        """
+        Returns the set of the given listing IDs that are already in the store.
+        """
+        keys = {}
+        for listing_id in listing_ids:
+            key = listing_id_key(listing_id)
+            if key is not None:
+                keys.setdefault(key, []).append(listing_id)
+        known = set()
+        key_list = list(keys)
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT listing_id FROM seen_ids WHERE listing_id IN ({placeholders})", chunk
+            ).fetchall()
+            for (key,) in rows:
+                known.update(keys[key])
+        return known
+
+    def add(self, key):
+        """
+        Adds a single unique key. Returns True if it was new.
+        """
+        return self.add_digests([key_digest(key)])[0]
+
+    def filter_new(self, cars):
+        """
+        Returns the cars whose keys are not in the store yet (also removing duplicates within 'cars')
+        and records their digests in the current transaction.
+        """
+        added = self.add_digests([key_digest(unique_key(car)) for car in cars])
+        self.add_ids(car.get('ID') for car in cars)
+        return [car for car, is_new in zip(cars, added) if is_new]
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        """
+        Forgets the digests added since the last commit (e.g. when writing the records failed).
+        """
+        self.connection.rollback()
+        self.count = self.connection.execute("SELECT value FROM meta WHERE name = 'count'").fetchone()[0]
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def import_csv(self, csv_path, batch_size=10000):
+        """
+        Seeds the store from an existing CSV file of offers (one-time migration).
+        Rows are streamed, so memory use does not depend on the file size.
+        """
+        imported = 0
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            batch = []
+            ids = []
+            for row in csv.DictReader(f):
+                batch.append(key_digest(unique_key(row)))
+                ids.append(row.get('ID'))
+                if len(batch) >= batch_size:
+                    imported += sum(self.add_digests(batch))
+                    self.add_ids(ids)
+                    batch = []
+                    ids = []
+            if batch:
+                imported += sum(self.add_digests(batch))
+                self.add_ids(ids)
+        self.commit()
+        return imported
+
+class GlobalDedupService:
+    """
+    Crawl-wide dedup shared by every base URL and worker.
+    A scalable Bloom filter answers "definitely new" in memory; only Bloom hits are confirmed
+    against the exact SQLite digest store, so a false positive never drops a new offer.
+    The Bloom filter is saved next to the store on close and rebuilt from the store if the
+    snapshot is missing, stale or truncated.
+    Same interface as DedupStore: filter_new / known_ids / commit / rollback / close / len().
+    """
+    def __init__(self, path, bloom_capacity=1_000_000, bloom_error_rate=0.001,
+                 bloom_max_bytes=256 * 1024 * 1024):
+        self.store = DedupStore(path)
+        self.bloom_path = path + ".bloom"
+        self.bloom_options = {
+            "initial_capacity": bloom_capacity,
+            "error_rate": bloom_error_rate,
+            "max_bytes": bloom_max_bytes,
+        }
+        self.bloom = ScalableBloomFilter(**self.bloom_options)
+        self.lock = threading.Lock()
+        self._load_bloom()
+
+        # Statistics
+        self.lookups = 0
+        self.bloom_negatives = 0
+        self.bloom_positives = 0
+        self.false_positives = 0
+
+    def _load_bloom(self):
+        if os.path.exists(self.bloom_path):
+            try:
+                stored_count = self.bloom.load(self.bloom_path)
+                if stored_count == len(self.store):
+                    return
+                if stored_count is None:
+                    print("[!] Bloom filter snapshot is truncated, rebuilding it from the dedup store.")
+                else:
+                    print("[!] Bloom filter snapshot is stale, rebuilding it from the dedup store.")
+            except (OSError, ValueError, struct.error) as e:
+                print(f"[!] Could not load Bloom filter snapshot: {e}")
+        self.bloom = ScalableBloomFilter(**self.bloom_options)
+        for digest in self.store.iter_digests():
+            self.bloom.add(digest)
+
+    def __len__(self):
+        return len(self.store)
+
+    def filter_new(self, cars):
+        """
+        Returns the cars not seen anywhere in the crawl yet (also removing duplicates within 'cars')
+        and records their digests in the current transaction.
+        """
+        with self.lock:
+            new_cars = []
+            new_digests = []
+            for car in cars:
+                digest = key_digest(unique_key(car))
+                self.lookups += 1
+                if digest in new_digests:
+                    continue
+                if digest in self.bloom:
+                    self.bloom_positives += 1
+                    if self.store.contains_digest(digest):
+                        continue
+                    self.false_positives += 1
+                else:
+                    self.bloom_negatives += 1
+                new_cars.append(car)
+                new_digests.append(digest)
+
+            self.store.add_digests(new_digests)
+            self.store.add_ids(car.get('ID') for car in cars)
+            for digest in new_digests:
+                self.bloom.add(digest)
+            return new_cars
+
+    def known_ids(self, listing_ids):
+        """
+        Returns the set of the given listing IDs already seen by the crawl.
+        """
+        with self.lock:
+            return self.store.known_ids(listing_ids)
+
+    def commit(self):
+        with self.lock:
+            self.store.commit()
+
+    def rollback(self):
+        # Digests already added to the Bloom filter stay there; they can only cause extra exact lookups
+        with self.lock:
+            self.store.rollback()
+
+    def close(self):
+        with self.lock:
+            self.store.close()
+            self.bloom.save(self.bloom_path, len(self.store))
+
+    def stats(self):
+        """
+        Returns the dedup counters, the Bloom filter memory use and its false-positive rates.
+        """
+        true_negatives = self.bloom_negatives + self.false_positives
+        return {
+            "unique_records": len(self.store),
+            "lookups": self.lookups,
+            "bloom_negatives": self.bloom_negatives,
+            "bloom_positives": self.bloom_positives,
+            "false_positives": self.false_positives,
+            "observed_false_positive_rate": self.false_positives / true_negatives if true_negatives else 0.0,
+            "estimated_false_positive_rate": self.bloom.estimated_error_rate(),
+            "bloom_filters": len(self.bloom.filters),
+            "bloom_memory_bytes": self.bloom.memory_bytes(),
+        }
+
+    def report(self):
+        stats = self.stats()
+        print(f"[*] Dedup: {stats['unique_records']} unique records, {stats['lookups']} lookups, "
+              f"{stats['bloom_positives']} Bloom hits ({stats['false_positives']} false positives).")
+        print(f"    Bloom filter: {stats['bloom_filters']} filters, "
+              f"{stats['bloom_memory_bytes'] / (1024 * 1024):.1f} MB, "
+              f"false-positive rate {stats['observed_false_positive_rate']:.4%} observed / "
+              f"{stats['estimated_false_positive_rate']:.4%} estimated.")
+
+def open_global_dedup(output_dir, **bloom_options):
+    """
+    Opens the crawl-wide dedup service stored in 'output_dir'. If the store does not exist yet,
+    it is seeded once from every otomoto_listings_N.csv already in 'output_dir'.
+    """
+    path = os.path.join(output_dir, "dedup.sqlite")
+    if not os.path.exists(path):
+        store = DedupStore(path)
+        for csv_path in sorted(glob.glob(os.path.join(output_dir, "otomoto_listings_*.csv"))):
+            imported = store.import_csv(csv_path)
+            print(f"Seeded dedup store with {imported} unique records from {csv_path}.")
+        store.close()
+
+    service = GlobalDedupService(path, **bloom_options)
+    print(f"Opened dedup store {path} ({len(service)} unique records).")
+    return service
@@ -0,0 +1,132 @@
+import time
+import queue
+import threading
+from contextlib import contextmanager
+import psutil
+
+# Number of browsers (defaults to one per core, each Chrome renders in its own processes)
+DEFAULT_POOL_SIZE = max(1, min(4, psutil.cpu_count() or 1))
+
+# A driver is restarted after this many leases (pages), before Chrome's memory use builds up
+DEFAULT_MAX_PAGES_PER_DRIVER = 200
+
+# A driver whose browser processes use more than this much memory is restarted
+DEFAULT_MEMORY_WATERMARK_MB = 1500
+
+class PooledDriver:
+    """
+    A webdriver of the pool and its usage since it was started.
+    """
+    def __init__(self, driver, index):
+        self.driver = driver
+        self.index = index
+        self.pages = 0
+        self.started_at = time.monotonic()
+
+    def memory_mb(self):
+        """
+        Returns the resident memory of the chromedriver process and every browser process it started
+        (None if it cannot be read).
+        """
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / (1024 * 1024)
+        except (AttributeError, psutil.Error):
+            return None
+
+    def is_healthy(self):
+        """
+        Checks that the browser still answers commands.
+        """
+        try:
+            self.driver.execute_script("return document.readyState")
+            return True
+        except Exception:
+            return False
+
+class DriverPool:
+    """
+    A fixed number of browsers, started once and leased to worker threads one page at a time.
+    - create_driver: function returning a new, configured webdriver
+    - size: number of browsers
+    - max_pages: leases after which a browser is restarted
+    - memory_watermark_mb: memory use after which a browser is restarted (None disables the check)
+    A driver is health-checked before every lease and restarted if it stopped answering.
+    Usage:
+        with pool.lease() as driver:
+            driver.get(url)
+    """
+    def __init__(self, create_driver, size=DEFAULT_POOL_SIZE, max_pages=DEFAULT_MAX_PAGES_PER_DRIVER,
+                 memory_watermark_mb=DEFAULT_MEMORY_WATERMARK_MB):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.create_driver = create_driver
+        self.size = size
+        self.max_pages = max_pages
+        self.memory_watermark_mb = memory_watermark_mb
+        self.idle = queue.Queue()
+        self.drivers = []
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.leases = 0
+        self.recycled = {"pages": 0, "memory": 0, "unhealthy": 0}
+
+        for index in range(size):
+            pooled = PooledDriver(create_driver(), index)
+            self.drivers.append(pooled)
+            self.idle.put(pooled)
+        print(f"[*] Started {size} browsers.")
+
+    def _recycle(self, pooled, reason):
+        """
+        Quits the browser of 'pooled' and starts a new one in its place.
+        """
+        print(f"[*] Restarting browser {pooled.index} ({reason}, {pooled.pages} pages).")
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            print(f"[!] Error closing browser {pooled.index}: {e}")
+        replacement = PooledDriver(self.create_driver(), pooled.index)
+        with self.lock:
+            self.recycled[reason] += 1
+            self.drivers[pooled.index] = replacement
+        return replacement
+
+    def _check_after_use(self, pooled):
+        if pooled.pages >= self.max_pages:
+            return self._recycle(pooled, "pages")
+        if self.memory_watermark_mb is not None:
+            memory = pooled.memory_mb()
+            if memory is not None and memory > self.memory_watermark_mb:
+                return self._recycle(pooled, "memory")
+        return pooled
+
+    @contextmanager
+    def lease(self):
+        """
+        Lends an idle driver to the caller for one page; blocks while every driver is busy.
+        """
+        pooled = self.idle.get()
+        try:
+            if not pooled.is_healthy():
+                pooled = self._recycle(pooled, "unhealthy")
+            with self.lock:
+                self.leases += 1
+            yield pooled.driver
+            pooled.pages += 1
+            pooled = self._check_after_use(pooled)
+        finally:
+            self.idle.put(pooled)
+
+    def close(self):
+        for pooled in self.drivers:
+            try:
+                pooled.driver.quit()
+            except Exception as e:
+                print(f"[!] Error closing browser {pooled.index}: {e}")
+
+    def report(self):
+        restarts = ", ".join(f"{count} for {reason}" for reason, count in self.recycled.items())
+        print(f"[*] Driver pool: {self.size} browsers, {self.leases} pages, restarts: {restarts}.")
@@ -1,80 +1,450 @@
 import pandas as pd
-import pyodbc
 import sys
 import math
-from scripts.connect_sql import get_connection  # Import the SQL connection module
-
-# Establish the SQL connection
-conn = get_connection()
-cursor = conn.cursor()
-
-# Load data from the CSV file into a DataFrame
-df = pd.read_csv("data/cleaned_otomoto_data.csv")
-
-# Replace empty strings with None
-df.replace("", None, inplace=True)
-
-# Ensure that all NaN values in the DataFrame are replaced with None
-df = df.where(pd.notnull(df), None)
-
-# Define the SQL INSERT query for the 'cars' table
-query = (
-    "INSERT INTO cars (Make, Model, Engine_capacity, Power_HP, Mileage_in_km, Fuel_Type, "
-    "Gearbox, Year, City, Province, Seller_Type, Price, Currency, Otomoto_ID, Otomoto_Indicator, "
-    "Title, Link, Description, Scraping_Date) "
-    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-)
-
-# Iterate over each row in the DataFrame
-for index, row in df.iterrows():
-    # Ensure that the 'Description' field is a string
-    description = (row["Description"] or "") + ""
-    
-    # Convert numeric values: if a value is NaN, replace it with None
-    engine_capacity = None if (isinstance(row["Engine capacity"], float) and math.isnan(row["Engine capacity"])) else row["Engine capacity"]
-    power = None if (isinstance(row["Power"], float) and math.isnan(row["Power"])) else row["Power"]
-    mileage = None if (isinstance(row["Mileage in km"], float) and math.isnan(row["Mileage in km"])) else row["Mileage in km"]
-    price = None if (isinstance(row["Price"], float) and math.isnan(row["Price"])) else row["Price"]
-    
-    # Prepare the list of parameters; text fields remain unchanged
-    params = [
-        row["Make"],
-        row["Model"],
-        engine_capacity,
-        power,
-        mileage,
-        row["Fuel Type"] if row["Fuel Type"] is not None else None,
-        row["Gearbox"],
-        row["Year"],
-        row["City"],
-        row["Province"],
-        row["Seller Type"],
-        price,
-        row["Currency"],
-        row["ID"],
-        row["Otomoto Indicator"] if row["Otomoto Indicator"] is not None else None,
-        row["Title"],
-        row["Link"],
-        description,
-        row["Scraping Date"]
-    ]
-    
-    # Uncomment the following block to log parameters for debugging purposes
-    '''
-    print(f"Record {index} parameters:")
-    for i, p in enumerate(params, start=1):
-        print(f"  Parameter {i}: {p!r}")
-    '''
-    
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from scripts.db_backends import get_backend  # SQL Server, SQLite or DuckDB (DB_BACKEND)
+
+# Rows sent to the server in one parameter array (and committed in one transaction)
+DEFAULT_BATCH_SIZE = 5000
+
+# Rows read from the CSV file at a time by the streaming loader
+DEFAULT_CHUNKSIZE = 50_000
+
+# Worker threads of the parallel loader (each one holds a pooled connection)
+DEFAULT_WORKERS = 4
+
+# How often the reader checks for failed workers while the range queue is full (seconds)
+QUEUE_POLL_SECONDS = 1.0
+
+# Staging table of the upsert (see sql/create_tables.sql)
+STAGING_TABLE = "cars_staging"
+
+# Columns of the 'cars' table and the CSV columns they are loaded from
+COLUMNS = [
+    ("Make", "Make"),
+    ("Model", "Model"),
+    ("Engine_capacity", "Engine capacity"),
+    ("Power_HP", "Power"),
+    ("Mileage_in_km", "Mileage in km"),
+    ("Fuel_Type", "Fuel Type"),
+    ("Gearbox", "Gearbox"),
+    ("Year", "Year"),
+    ("City", "City"),
+    ("Province", "Province"),
+    ("Seller_Type", "Seller Type"),
+    ("Price", "Price"),
+    ("Currency", "Currency"),
+    ("Otomoto_ID", "ID"),
+    ("Otomoto_Indicator", "Otomoto Indicator"),
+    ("Title", "Title"),
+    ("Link", "Link"),
+    ("Description", "Description"),
+    ("Scraping_Date", "Scraping Date"),
+]
+
+# Types of the CSV columns, so every chunk is parsed the same way without type inference.
+# Integer columns use pandas' nullable Int64, so a missing year or ID does not turn them into floats.
+CSV_DTYPES = {
+    "Make": "object",
+    "Model": "object",
+    "Engine capacity": "float64",
+    "Power": "float64",
+    "Mileage in km": "float64",
+    "Fuel Type": "object",
+    "Gearbox": "object",
+    "Year": "Int64",
+    "City": "object",
+    "Province": "object",
+    "Seller Type": "object",
+    "Price": "float64",
+    "Currency": "object",
+    "ID": "Int64",
+    "Otomoto Indicator": "object",
+    "Title": "object",
+    "Link": "object",
+    "Description": "object",
+    "Scraping Date": "object",
+}
+
+def insert_query(table="cars"):
+    """
+    Returns the SQL INSERT query for 'table'.
+    """
+    columns = ", ".join(column for column, _ in COLUMNS)
+    placeholders = ", ".join("?" for _ in COLUMNS)
+    return f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+
+def load_dataframe(path="data/cleaned_otomoto_data.csv"):
+    """
+    Loads the cleaned CSV file into a DataFrame with empty values replaced by None.
+    """
+    df = pd.read_csv(path)
+
+    # Replace empty strings with None
+    df.replace("", None, inplace=True)
+
+    # Ensure that all NaN values in the DataFrame are replaced with None
+    df = df.where(pd.notnull(df), None)
+    return df
+
+def build_params(df):
+    """
+    Returns the parameter tuples of every row, in the column order of 'insert_query'.
+    Every column is converted at once into an array of Python objects with None for NaN / NA
+    (numpy scalars are turned into int / float, which the database drivers accept); the rows are
+    then zipped from the column arrays. The description is always a string.
+    """
+    arrays = []
+    for _, source in COLUMNS:
+        values = df[source].to_numpy(dtype=object, na_value=None)
+        if source == "Description":
+            values[pd.isnull(values)] = ""
+        arrays.append(values)
+    return list(zip(*arrays))
+
+def iter_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Reads the CSV file 'chunksize' rows at a time with the types of CSV_DTYPES (empty fields are
+    read as missing values). Yields the parameter tuples of every chunk (see 'build_params').
+    """
+    reader = pd.read_csv(path, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        yield build_params(chunk)
+
+def load_row_by_row(backend, conn, df, table="cars"):
+    """
+    Original loader: one INSERT and one commit per row, with a log line per record.
+    Kept as the baseline of 'benchmark_loaders'. Returns the number of rows inserted.
+    """
+    cursor = conn.cursor()
+    query = insert_query(table)
+
+    # Iterate over each row in the DataFrame
+    for index, row in df.iterrows():
+        # Ensure that the 'Description' field is a string
+        description = (row["Description"] or "") + ""
+
+        # Convert numeric values: if a value is NaN, replace it with None
+        engine_capacity = None if (isinstance(row["Engine capacity"], float) and math.isnan(row["Engine capacity"])) else row["Engine capacity"]
+        power = None if (isinstance(row["Power"], float) and math.isnan(row["Power"])) else row["Power"]
+        mileage = None if (isinstance(row["Mileage in km"], float) and math.isnan(row["Mileage in km"])) else row["Mileage in km"]
+        price = None if (isinstance(row["Price"], float) and math.isnan(row["Price"])) else row["Price"]
+
+        # Prepare the list of parameters; text fields remain unchanged
+        params = [
+            row["Make"],
+            row["Model"],
+            engine_capacity,
+            power,
+            mileage,
+            row["Fuel Type"] if row["Fuel Type"] is not None else None,
+            row["Gearbox"],
+            row["Year"],
+            row["City"],
+            row["Province"],
+            row["Seller Type"],
+            price,
+            row["Currency"],
+            row["ID"],
+            row["Otomoto Indicator"] if row["Otomoto Indicator"] is not None else None,
+            row["Title"],
+            row["Link"],
+            description,
+            row["Scraping Date"]
+        ]
+
+        try:
+            cursor.execute(query, params)
+            conn.commit()
+            print(f"✅ Record inserted at index: {index}\n")
+        except Exception as e:
+            print(f"❌ Error inserting record at index {index}: {e}")
+            print("Record data:")
+            print(row.to_dict())
+            raise
+    return len(df)
+
+def load_batched(backend, conn, df, table="cars", batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Batched loader: sends the rows in batches with the backend's bulk insert ('fast_executemany'
+    on SQL Server), one transaction per batch, and reports progress once per batch. A failing batch
+    is rolled back and the error re-raised; the batches before it stay committed.
+    Returns the number of rows inserted.
+    """
+    params = build_params(df)
+    return insert_batches(backend, conn, insert_query(table), params, batch_size, total=len(params))
+
+def insert_batches(backend, conn, query, params, batch_size=DEFAULT_BATCH_SIZE, total=None, done=0,
+                   start=None, label=""):
+    """
+    Inserts 'params' in batches of 'batch_size', one transaction per batch, printing the progress
+    (prefixed with 'label') after every batch. 'done' and 'start' carry the progress over from
+    earlier calls (chunks). Returns the number of rows inserted so far.
+    """
+    if start is None:
+        start = time.perf_counter()
+    for offset in range(0, len(params), batch_size):
+        batch = params[offset:offset + batch_size]
+        try:
+            backend.begin(conn)
+            backend.insert_rows(conn, query, batch)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error inserting rows {done}-{done + len(batch) - 1}: {e}")
+            raise
+        done += len(batch)
+        elapsed = time.perf_counter() - start
+        progress = f"{done}/{total}" if total is not None else f"{done}"
+        print(f"✅ {label}Inserted {progress} rows ({done / elapsed:.0f} rows/s).")
+    return done
+
+def load_streaming(backend, conn, path, table="cars", chunksize=DEFAULT_CHUNKSIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streaming loader: reads the CSV file chunk by chunk ('iter_chunks') and sends every chunk
+    straight to the batched inserter, so only one chunk is in memory at a time and the peak memory
+    does not depend on the size of the file.
+    Returns the number of rows inserted.
+    """
+    query = insert_query(table)
+    done = 0
+    start = time.perf_counter()
+    for params in iter_chunks(path, chunksize):
+        done = insert_batches(backend, conn, query, params, batch_size, done=done, start=start)
+    return done
+
+def iter_ranges(data, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Splits the input into consecutive ranges of 'chunksize' rows and yields the parameter tuples of
+    every range: chunks of the CSV file if 'data' is a path, slices of the DataFrame otherwise.
+    """
+    if isinstance(data, str):
+        yield from iter_chunks(data, chunksize)
+    else:
+        for offset in range(0, len(data), chunksize):
+            yield build_params(data.iloc[offset:offset + chunksize])
+
+def load_parallel(backend, data, table=STAGING_TABLE, workers=DEFAULT_WORKERS, chunksize=DEFAULT_CHUNKSIZE,
+                  batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Parallel loader: the input is split into ranges of 'chunksize' rows ('iter_ranges') and
+    'workers' threads insert them into 'table', each over its own connection from the backend's
+    pool (which needs at least 'workers' free connections). The database drivers release the GIL
+    while a statement runs, so the sessions load side by side on the server. The ranges are handed
+    out through a bounded queue, so about two ranges per worker are in memory at a time.
+    Every batch is committed on its own: load into the staging table and let 'load_upsert' publish
+    the rows in one transaction. After a failing batch (or a worker that could not get a
+    connection) no further ranges are handed out and the error is re-raised.
+    Returns the number of rows inserted; raises RuntimeError if it differs from the number of rows read.
+    """
+    ranges = queue.Queue(maxsize=workers * 2)
+    failed = threading.Event()
+    query = insert_query(table)
+    start = time.perf_counter()
+
+    def worker(index):
+        done = 0
+        error = None
+        try:
+            with backend.connection() as conn:
+                while True:
+                    params = ranges.get()
+                    if params is None:
+                        break
+                    if error is not None:
+                        # Keep taking ranges so the reader is never blocked on a full queue
+                        continue
+                    try:
+                        done = insert_batches(backend, conn, query, params, batch_size, done=done, start=start,
+                                              label=f"[worker {index}] ")
+                    except Exception as e:
+                        error = e
+                        failed.set()
+        except Exception as e:
+            # No connection could be opened (or returned); this worker takes no more ranges
+            error = error or e
+            failed.set()
+        if error is not None:
+            raise error
+        return done
+
+    def hand_out(item, stop_on_failure):
+        """
+        Puts 'item' on the range queue, waiting while it is full. Gives up (returns False) once
+        every worker has exited, or with 'stop_on_failure' as soon as a worker failed.
+        """
+        while True:
+            try:
+                ranges.put(item, timeout=QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                if (stop_on_failure and failed.is_set()) or all(future.done() for future in futures):
+                    return False
+
+    read = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker, index) for index in range(workers)]
+        try:
+            for params in iter_ranges(data, chunksize):
+                if failed.is_set() or not hand_out(params, stop_on_failure=True):
+                    break
+                read += len(params)
+        finally:
+            for _ in futures:
+                if not hand_out(None, stop_on_failure=False):
+                    break
+        # Re-raises the error of a failed worker
+        inserted = sum(future.result() for future in futures)
+
+    if inserted != read:
+        raise RuntimeError(f"Loaded {inserted} rows into {table}, but {read} rows were read.")
+    elapsed = time.perf_counter() - start
+    print(f"✅ Loaded {inserted} rows into {table} with {workers} workers in {elapsed:.1f}s "
+          f"({inserted / elapsed:.0f} rows/s).")
+    return inserted
+
+def load_upsert(backend, conn, data, table="cars", staging_table=STAGING_TABLE, batch_size=DEFAULT_BATCH_SIZE,
+                chunksize=DEFAULT_CHUNKSIZE, workers=1):
+    """
+    Idempotent loader: bulk-loads the rows into the staging table, then applies
+    one set-based upsert keyed on Otomoto_ID in a single transaction (a MERGE on SQL Server, see
+    'SqlServerBackend.merge_query'). Loading the same file again changes nothing; a daily load only
+    writes the new and changed listings.
+    'data' is a DataFrame (loaded with 'load_batched') or the path of a CSV file, which is streamed
+    into the staging table chunk by chunk with 'load_streaming'. With 'workers' > 1 either one is
+    loaded by 'load_parallel' over that many more pooled connections.
+    The rows in the staging table are counted before the upsert; if they differ from the rows
+    loaded, nothing is merged. The upsert is the only step that writes to 'table', so readers see
+    either none or all of the load.
+    Returns a dictionary with the number of staged, inserted, updated and unchanged rows.
+    """
+    backend.begin(conn)
+    backend.truncate(conn, staging_table)
+    conn.commit()
+    if workers > 1:
+        staged = load_parallel(backend, data, table=staging_table, workers=workers, chunksize=chunksize,
+                               batch_size=batch_size)
+    elif isinstance(data, str):
+        staged = load_streaming(backend, conn, data, table=staging_table, chunksize=chunksize, batch_size=batch_size)
+    else:
+        staged = load_batched(backend, conn, data, table=staging_table, batch_size=batch_size)
+
+    start = time.perf_counter()
     try:
-        cursor.execute(query, *params)
+        backend.begin(conn)
+        cursor = conn.cursor()
+        in_staging = cursor.execute(f"SELECT COUNT(*) FROM {staging_table}").fetchone()[0]
+        if in_staging != staged:
+            raise RuntimeError(f"{staging_table} holds {in_staging} rows, but {staged} rows were loaded.")
+        without_id = cursor.execute(f"SELECT COUNT(*) FROM {staging_table} WHERE Otomoto_ID IS NULL").fetchone()[0]
+        # Listings merged: every Otomoto_ID once, as 'ranked_staging_sql' drops the older copies
+        distinct_ids = cursor.execute(f"SELECT COUNT(DISTINCT Otomoto_ID) FROM {staging_table}").fetchone()[0]
+        inserted, updated = backend.upsert(conn, [column for column, _ in COLUMNS], table, staging_table)
+        backend.truncate(conn, staging_table)
         conn.commit()
-        print(f"✅ Record inserted at index: {index}\n")
     except Exception as e:
-        print(f"❌ Error inserting record at index {index}: {e}")
-        print("Record data:")
-        print(row.to_dict())
-        sys.exit(1)
+        conn.rollback()
+        print(f"❌ Error merging {staging_table} into {table}: {e}")
+        raise
+
+    counts = {
+        "staged": staged,
+        "inserted": inserted,
+        "updated": updated,
+    }
+    counts["unchanged"] = distinct_ids - counts["inserted"] - counts["updated"]
+    repeated = staged - without_id - distinct_ids
+    print(f"✅ Merged into {table} in {time.perf_counter() - start:.1f}s: {counts['inserted']} inserted, "
+          f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+          + (f", {repeated} repeated rows of a listing skipped" if repeated else "")
+          + (f", {without_id} rows without an Otomoto ID skipped." if without_id else "."))
+    return counts
+
+def benchmark_loaders(backend, conn, df, sample_rows=1000, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Measures the rows/sec of the row-by-row loop and of the batched loader on the first
+    'sample_rows' rows, loading them into a temporary copy of the 'cars' table (dropped afterwards).
+    Returns {loader name: rows per second}.
+    """
+    sample = df.head(sample_rows)
+    results = {}
+    for name, loader, options in [("row by row", load_row_by_row, {}),
+                                  ("batched", load_batched, {"batch_size": batch_size})]:
+        table = backend.create_scratch_table(conn, "cars_benchmark")
+        conn.commit()
+        start = time.perf_counter()
+        rows = loader(backend, conn, sample, table=table, **options)
+        results[name] = rows / (time.perf_counter() - start)
+        backend.drop_table(conn, table)
+        conn.commit()
 
-# Close the SQL connection
-conn.close()
\ No newline at end of file
+    print(f"[*] Loader benchmark on {len(sample)} rows ({backend.name}):")
+    for name, rows_per_second in results.items():
+        print(f"    {name:<10} {rows_per_second:>10.0f} rows/s")
+    print(f"    speed-up: {results['batched'] / results['row by row']:.1f}x")
+    return results
+
+def benchmark_parallel(backend, conn, data, worker_counts=(1, 2, 4), staging_table=STAGING_TABLE,
+                       chunksize=DEFAULT_CHUNKSIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Measures the rows/sec of 'load_parallel' with every number of workers in 'worker_counts',
+    loading 'data' into the staging table (emptied before every run and afterwards; the target
+    table is not touched). The backend's pool needs max(worker_counts) connections besides 'conn'.
+    Returns {workers: rows per second}.
+    """
+    results = {}
+    for workers in worker_counts:
+        backend.begin(conn)
+        backend.truncate(conn, staging_table)
+        conn.commit()
+        start = time.perf_counter()
+        rows = load_parallel(backend, data, table=staging_table, workers=workers, chunksize=chunksize,
+                             batch_size=batch_size)
+        results[workers] = rows / (time.perf_counter() - start)
+    backend.begin(conn)
+    backend.truncate(conn, staging_table)
+    conn.commit()
+
+    print(f"[*] Parallel loader scaling ({backend.name}, ranges of {chunksize} rows):")
+    baseline = results[worker_counts[0]]
+    for workers, rows_per_second in results.items():
+        print(f"    {workers:>2} workers {rows_per_second:>10.0f} rows/s  {rows_per_second / baseline:.1f}x")
+    return results
+
+if __name__ == "__main__":
+    # Set to True to compare the batched loader with the row-by-row loop before loading
+    BENCHMARK = False
+
+    # Set to True to stream the CSV file in chunks of CHUNKSIZE rows instead of loading it whole
+    STREAMING = True
+    CHUNKSIZE = DEFAULT_CHUNKSIZE
+
+    # Worker threads loading the staging table (1 loads over the main connection only); set
+    # BENCHMARK_WORKERS to True to measure the scaling from 1 to WORKERS workers first
+    WORKERS = DEFAULT_WORKERS
+    BENCHMARK_WORKERS = False
+
+    CSV_PATH = "data/cleaned_otomoto_data.csv"
+
+    # Database backend from DB_BACKEND: 'sqlserver' (default), 'sqlite' or 'duckdb'.
+    # The pool holds the main connection and one connection per worker.
+    backend = get_backend(pool_size=WORKERS + 1)
+
+    try:
+        with backend.connection() as conn:
+            if BENCHMARK:
+                benchmark_loaders(backend, conn, load_dataframe(CSV_PATH))
+            # A path is streamed chunk by chunk, a DataFrame is loaded at once
+            data = CSV_PATH if STREAMING else load_dataframe(CSV_PATH)
+            if BENCHMARK_WORKERS:
+                worker_counts = sorted({1, *(2 ** power for power in range(1, WORKERS.bit_length())), WORKERS})
+                benchmark_parallel(backend, conn, data, worker_counts, chunksize=CHUNKSIZE)
+            load_upsert(backend, conn, data, batch_size=DEFAULT_BATCH_SIZE, chunksize=CHUNKSIZE, workers=WORKERS)
+    except Exception:
+        sys.exit(1)
+    finally:
+        # Close the database connections
+        backend.close()
@@ -0,0 +1,178 @@
+import re
+import time
+
+# Output columns and the key of their selector in the map returned by 'detect_selectors'.
+# 'text' fields take the element's text, 'href' fields take its link.
+FIELDS = [
+    ("Title", "title", "text"),
+    ("Link", "link", "href"),
+    ("Description", "description", "text"),
+    ("Mileage", "mileage", "text"),
+    ("Fuel Type", "fuel_type", "text"),
+    ("Gearbox", "gearbox", "text"),
+    ("Year", "year", "text"),
+    ("Location", "location", "text"),
+    ("Seller Type", "seller_type", "text"),
+    ("Price", "price", "text"),
+    ("Currency", "currency", "text"),
+    ("Otomoto Indicator", "otomoto_indicator", "text"),
+]
+
+# Selectors used when 'detect_selectors' did not find a field on the sample offer
+DEFAULT_SELECTORS = {
+    "title": "h2 a",
+    "link": "h2 a",
+    "description": "p",
+    "mileage": "dd[data-parameter='mileage']",
+    "fuel_type": "dd[data-parameter='fuel_type']",
+    "gearbox": "dd[data-parameter='gearbox']",
+    "year": "dd[data-parameter='year']",
+    "location": "dl p",
+    "seller_type": "article li",
+    "price": "h3",
+    "currency": "p",
+    "otomoto_indicator": "p",
+}
+
+# One compound selector: tag, .class and [attr] / [attr='value'] parts (no combinators)
+COMPOUND_PATTERN = re.compile(
+    r"(?P<tag>[a-zA-Z][a-zA-Z0-9-]*)?"
+    r"(?P<rest>(?:\.[\w-]+|\[[\w-]+(?:=(?:'[^']*'|\"[^\"]*\"|[\w-]+))?\])*)$"
+)
+PART_PATTERN = re.compile(r"\.([\w-]+)|\[([\w-]+)(?:=(?:'([^']*)'|\"([^\"]*)\"|([\w-]+)))?\]")
+
+class CompoundSelector:
+    """
+    A single compound selector such as dd[data-parameter='mileage'] or p.ooa-gmxnzj.
+    """
+    def __init__(self, text):
+        match = COMPOUND_PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Unsupported selector part: '{text}'")
+        self.tag = match.group("tag").lower() if match.group("tag") else None
+        self.classes = []
+        self.attributes = []
+        for part in PART_PATTERN.finditer(match.group("rest")):
+            class_name, attr_name = part.group(1), part.group(2)
+            if class_name:
+                self.classes.append(class_name)
+            else:
+                value = next((v for v in part.group(3, 4, 5) if v is not None), None)
+                self.attributes.append((attr_name, value))
+
+    def matches(self, parser, node, tag):
+        if self.tag is not None and tag != self.tag:
+            return False
+        if self.classes:
+            node_classes = parser.classes(node)
+            if any(class_name not in node_classes for class_name in self.classes):
+                return False
+        for name, value in self.attributes:
+            actual = parser.attr(node, name)
+            if actual is None or (value is not None and actual != value):
+                return False
+        return True
+
+def compile_selector(selector):
+    """
+    Compiles a CSS selector made of compound selectors joined by descendant combinators
+    (e.g. "dl.ooa-1o0axny p.ooa-gmxnzj") into a list of CompoundSelector, outermost first.
+    """
+    return [CompoundSelector(part) for part in selector.split()]
+
+class ExtractionPlan:
+    """
+    Extracts all listing fields in a single walk over the listing subtree.
+    - selectors: selector map as returned by 'detect_selectors' (missing keys fall back to DEFAULT_SELECTORS)
+    - parser: parser backend from scripts.html_parsers
+    - text_filters: optional {selector key: predicate(text)} - the element must also match the predicate
+      (used by the Selenium scraper to pick the currency / description / indicator paragraphs)
+    - timed: collect per-field matching time in 'field_timings'
+    Each element is visited once; every field keeps the first matching element in document order,
+    which is what 'select_one' returns. The walk stops as soon as all fields are filled.
+    """
+    def __init__(self, selectors, parser, text_filters=None, timed=False):
+        self.parser = parser
+        self.text_filters = text_filters or {}
+        self.timed = timed
+        self.fields = []
+        for column, key, kind in FIELDS:
+            selector = selectors.get(key) or DEFAULT_SELECTORS[key]
+            self.fields.append((column, key, kind, compile_selector(selector)))
+
+        # Statistics
+        self.field_timings = {column: 0.0 for column, _, _, _ in self.fields}
+        self.field_hits = {column: 0 for column, _, _, _ in self.fields}
+        self.listings = 0
+
+    def _matches(self, compounds, node, tag, ancestors):
+        """
+        Checks 'node' against a descendant-combinator selector using its ancestor chain.
+        """
+        if not compounds[-1].matches(self.parser, node, tag):
+            return False
+        remaining = len(compounds) - 2
+        for ancestor, ancestor_tag in reversed(ancestors):
+            if remaining < 0:
+                break
+            if compounds[remaining].matches(self.parser, ancestor, ancestor_tag):
+                remaining -= 1
+        return remaining < 0
+
+    def extract(self, listing):
+        """
+        Returns the record dictionary for a single listing element.
+        """
+        parser = self.parser
+        record = {"ID": parser.attr(listing, "data-id", "N/A")}
+        pending = list(self.fields)
+        timed = self.timed
+
+        # Depth-first walk; every stack entry carries the ancestor chain of its node
+        root_entry = (listing, parser.tag(listing))
+        stack = [(child, [root_entry]) for child in reversed(parser.children(listing))]
+        while stack and pending:
+            node, ancestors = stack.pop()
+            tag = parser.tag(node)
+            text = None
+
+            for field in list(pending):
+                column, key, kind, compounds = field
+                start = time.perf_counter() if timed else 0.0
+                matched = self._matches(compounds, node, tag, ancestors)
+                if matched and key in self.text_filters:
+                    if text is None:
+                        text = parser.text(node).strip()
+                    matched = bool(text) and self.text_filters[key](text)
+                if matched:
+                    if kind == "href":
+                        record[column] = parser.attr(node, "href")
+                    else:
+                        if text is None:
+                            text = parser.text(node).strip()
+                        record[column] = text
+                    pending.remove(field)
+                    self.field_hits[column] += 1
+                if timed:
+                    self.field_timings[column] += time.perf_counter() - start
+
+            if pending:
+                child_ancestors = ancestors + [(node, tag)]
+                for child in reversed(parser.children(node)):
+                    stack.append((child, child_ancestors))
+
+        for column, _, _, _ in pending:
+            record[column] = "N/A"
+        self.listings += 1
+
+        # Keep the usual column order
+        return {column: record[column] for column in ["ID"] + [field[0] for field in FIELDS]}
+
+    def report(self):
+        """
+        Prints the matching time and hit rate of every field, most expensive first.
+        """
+        print(f"[*] Extraction plan: {self.listings} listings")
+        for column, seconds in sorted(self.field_timings.items(), key=lambda item: -item[1]):
+            hit_rate = self.field_hits[column] / self.listings if self.listings else 0.0
+            print(f"  {column:<18} {seconds * 1000:9.1f} ms   found in {hit_rate:6.1%} of listings")
@@ -0,0 +1,279 @@
+import sys
+import time
+import tracemalloc
+
+# Backend used when none is requested explicitly
+DEFAULT_BACKEND = "html.parser"
+
+class BeautifulSoupBackend:
+    """
+    BeautifulSoup with the built-in 'html.parser' tree builder (the original behaviour).
+    """
+    name = "html.parser"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self.BeautifulSoup = BeautifulSoup
+
+    def parse(self, html):
+        return self.BeautifulSoup(html, "html.parser")
+
+    def select(self, node, selector):
+        return node.select(selector)
+
+    def select_one(self, node, selector):
+        return node.select_one(selector)
+
+    def text(self, node):
+        return node.get_text()
+
+    def attr(self, node, name, default=None):
+        return node.get(name, default)
+
+    def tag(self, node):
+        return node.name
+
+    def classes(self, node):
+        return node.get("class", [])
+
+    def children(self, node):
+        return node.find_all(True, recursive=False)
+
+    def page_text(self, document):
+        # get_text() already skips <script> and <style> contents
+        return document.get_text()
+
+class LxmlBackend:
+    """
+    lxml.html tree with compiled CSS selectors (requires 'lxml' and 'cssselect').
+    """
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from lxml.cssselect import CSSSelector
+        self.lxml_html = lxml.html
+        self.CSSSelector = CSSSelector
+        self.compiled = {}
+
+    def _compile(self, selector):
+        if selector not in self.compiled:
+            self.compiled[selector] = self.CSSSelector(selector)
+        return self.compiled[selector]
+
+    def parse(self, html):
+        return self.lxml_html.document_fromstring(html)
+
+    def select(self, node, selector):
+        # Match descendants only, like BeautifulSoup's select()
+        return [match for match in self._compile(selector)(node) if match is not node]
+
+    def select_one(self, node, selector):
+        for match in self._compile(selector)(node):
+            if match is not node:
+                return match
+        return None
+
+    def text(self, node):
+        return node.text_content()
+
+    def attr(self, node, name, default=None):
+        return node.get(name, default)
+
+    def tag(self, node):
+        return node.tag
+
+    def classes(self, node):
+        return node.get("class", "").split()
+
+    def children(self, node):
+        # Skip comments and processing instructions
+        return [child for child in node if isinstance(child.tag, str)]
+
+    def page_text(self, document):
+        return "".join(document.xpath("//text()[not(ancestor::script) and not(ancestor::style)]"))
+
+class SelectolaxBackend:
+    """
+    selectolax with the lexbor engine (requires 'selectolax').
+    """
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self.LexborHTMLParser = LexborHTMLParser
+
+    def parse(self, html):
+        return self.LexborHTMLParser(html)
+
+    def select(self, node, selector):
+        return node.css(selector)
+
+    def select_one(self, node, selector):
+        return node.css_first(selector)
+
+    def text(self, node):
+        return node.text(deep=True)
+
+    def attr(self, node, name, default=None):
+        value = node.attributes.get(name, default)
+        # Attributes without a value (e.g. <div hidden>) are returned as None by lexbor
+        return "" if value is None and name in node.attributes else value
+
+    def tag(self, node):
+        return node.tag
+
+    def classes(self, node):
+        return (node.attributes.get("class") or "").split()
+
+    def children(self, node):
+        return list(node.iter(include_text=False))
+
+    def page_text(self, document):
+        if document.body is None:
+            return ""
+        return "".join(
+            node.text(deep=False)
+            for node in document.body.traverse(include_text=True)
+            if node.tag == "-text" and node.parent is not None and node.parent.tag not in ("script", "style")
+        )
+
+BACKENDS = {
+    BeautifulSoupBackend.name: BeautifulSoupBackend,
+    LxmlBackend.name: LxmlBackend,
+    SelectolaxBackend.name: SelectolaxBackend,
+}
+
+_instances = {}
+
+def get_backend(name=None):
+    """
+    Returns the (cached) parser backend called 'name': 'html.parser', 'lxml' or 'selectolax'.
+    Raises ImportError if the library behind the backend is not installed.
+    """
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend '{name}'. Available: {', '.join(BACKENDS)}")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+def available_backends():
+    """
+    Returns the names of the backends whose libraries are installed.
+    """
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def benchmark_backends(html_path="otomoto_sample.html", iterations=20, backends=None):
+    """
+    Parses 'html_path' with 'parse_page' 'iterations' times for each backend and prints
+    pages/sec and peak memory. Also checks that every backend produced identical records.
+    The DOM path is timed (json_first=False), otherwise every backend would only read __NEXT_DATA__;
+    the JSON-first path is timed as a row of its own.
+    Raises RuntimeError if the reference (first) backend extracts no records: the selectors no
+    longer match the page and the numbers would only time an empty select.
+    Returns a dictionary: backend name -> (pages_per_second, peak_memory_mb, records)
+    """
+    from scripts.extraction_plan import ExtractionPlan
+    from scripts.listings_scraping_with_BeautifulSoup import LISTING_SELECTORS, parse_page
+    from scripts.next_data import extract_listings_from_json
+
+    with open(html_path, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    results = {}
+    for name in backends or available_backends():
+        # Warm-up run (imports, selector compilation) is not measured
+        records, _ = parse_page(html, backend=name, json_first=False)
+        if not records and not results:
+            raise RuntimeError(f"Backend '{name}' extracted no records from {html_path} - "
+                               f"the listing selectors do not match the page.")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse_page(html, backend=name, json_first=False)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        pages_per_second = iterations / elapsed if elapsed else float("inf")
+        peak_mb = peak / (1024 * 1024)
+        results[name] = (pages_per_second, peak_mb, records)
+        print(f"{name:<12} {pages_per_second:8.2f} pages/sec   peak memory {peak_mb:8.1f} MB   "
+              f"{len(records)} records")
+
+        # Separate pass with per-field timing counters, so they do not skew the numbers above
+        plan = ExtractionPlan(LISTING_SELECTORS, get_backend(name), timed=True)
+        for _ in range(iterations):
+            parse_page(html, backend=name, plan=plan, json_first=False)
+        plan.report()
+
+    # The JSON-first path does not depend on the backend
+    start = time.perf_counter()
+    for _ in range(iterations):
+        json_records = extract_listings_from_json(html)
+    elapsed = time.perf_counter() - start
+    json_pages_per_second = iterations / elapsed if elapsed else float("inf")
+    print(f"{'json-first':<12} {json_pages_per_second:8.2f} pages/sec   "
+          f"{len(json_records or [])} records (__NEXT_DATA__, no HTML parsing)")
+
+    reference_name = next(iter(results), None)
+    for name, (_, _, records) in results.items():
+        if records != results[reference_name][2]:
+            print(f"[!] Backend '{name}' returned different records than '{reference_name}'.")
+    return results
+
+def check_json_parity(html_path="otomoto_sample.html", backend=None):
+    """
+    Compares the records of the JSON-first path with the DOM path (the extraction plan of
+    LISTING_SELECTORS) on a saved results page, field by field, matching listings on their ID.
+    A field the DOM path does not find ('N/A') while the JSON has it is a mismatch too: it means
+    a stale selector, and the dedup key of the two paths would differ.
+    Returns a list of mismatches: (listing ID, field, JSON value, DOM value)
+    """
+    from scripts.next_data import extract_listings_from_json
+    from scripts.listings_scraping_with_BeautifulSoup import LISTING_SELECTOR, get_extraction_plan
+
+    with open(html_path, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    name = backend or DEFAULT_BACKEND
+    parser = get_backend(name)
+    plan = get_extraction_plan(name)
+    dom_records = {}
+    for listing in parser.select(parser.parse(html), LISTING_SELECTOR):
+        record = plan.extract(listing)
+        dom_records[record["ID"]] = record
+    json_records = {record["ID"]: record for record in extract_listings_from_json(html) or []}
+
+    mismatches = []
+    for listing_id, json_record in json_records.items():
+        dom_record = dom_records.get(listing_id)
+        if dom_record is None:
+            mismatches.append((listing_id, "ID", listing_id, None))
+            continue
+        for field, json_value in json_record.items():
+            dom_value = dom_record.get(field, "N/A")
+            if dom_value != json_value:
+                mismatches.append((listing_id, field, json_value, dom_value))
+
+    print(f"[*] JSON / DOM parity ({name}): {len(json_records)} JSON records, {len(dom_records)} DOM records, "
+          f"{len(mismatches)} mismatches.")
+    for listing_id, field, json_value, dom_value in mismatches:
+        print(f"    {listing_id} {field}: JSON {json_value!r} != DOM {dom_value!r}")
+    return mismatches
+
+if __name__ == "__main__":
+    # Usage: python -m scripts.html_parsers [iterations] [html_path]
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    html_path = sys.argv[2] if len(sys.argv) > 2 else "otomoto_sample.html"
+    benchmark_backends(html_path, iterations)
+    check_json_parity(html_path)
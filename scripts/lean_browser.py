@@ -0,0 +1,146 @@
+import time
+import threading
+from scripts.next_data import json_loads, advert_to_car
+
+# Requests the listing data does not need: images, fonts, media and ad / analytics scripts
+BLOCKED_URL_PATTERNS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*.mp4", "*.webm",
+    "*doubleclick.net*", "*googlesyndication.com*", "*googletagmanager.com*",
+    "*google-analytics.com*", "*facebook.net*", "*hotjar.com*", "*criteo.*", "*adnxs.com*",
+    "*ninja.data.olxcdn.com*",
+]
+
+# Runs in the page: reads the search results from the __NEXT_DATA__ payload and returns only the
+# fields used by 'advert_to_car', as one JSON string. 'nodes' is null if the payload is missing;
+# 'captcha' is only checked on pages without results; 'transferred' sums the bytes of the
+# document and every resource it loaded.
+EXTRACT_LISTINGS_JS = r"""
+const result = {nodes: null, captcha: false, transferred: 0};
+const timing = performance.getEntriesByType("navigation").concat(performance.getEntriesByType("resource"));
+result.transferred = timing.reduce((total, entry) => total + (entry.transferSize || 0), 0);
+
+const script = document.getElementById("__NEXT_DATA__");
+if (script) {
+    try {
+        const urqlState = JSON.parse(script.textContent).props.pageProps.urqlState;
+        for (const entry of Object.values(urqlState)) {
+            if (!entry || !entry.data || entry.data.indexOf('"advertSearch":') === -1) continue;
+            const edges = JSON.parse(entry.data).advertSearch.edges || [];
+            result.nodes = edges.filter(edge => edge && edge.node).map(({node}) => ({
+                id: node.id,
+                title: node.title,
+                url: node.url,
+                shortDescription: node.shortDescription,
+                parameters: (node.parameters || []).map(p => ({key: p.key, displayValue: p.displayValue})),
+                location: node.location,
+                sellerLink: node.sellerLink ? {name: node.sellerLink.name, websiteUrl: node.sellerLink.websiteUrl,
+                                               logo: !!node.sellerLink.logo} : null,
+                brandProgram: node.brandProgram ? {name: node.brandProgram.name, searchUrl: node.brandProgram.searchUrl,
+                                                   logo: !!node.brandProgram.logo} : null,
+                price: node.price ? {amount: node.price.amount} : null,
+                priceEvaluation: node.priceEvaluation,
+            }));
+            break;
+        }
+    } catch (e) {
+        result.nodes = null;
+    }
+}
+if (!result.nodes || !result.nodes.length) {
+    const text = (document.body ? document.body.textContent : "").toLowerCase();
+    result.captcha = text.indexOf("captcha") !== -1 || text.indexOf("zbyt wiele zapyta") !== -1;
+}
+return JSON.stringify(result);
+"""
+
+# Runs in the page: bytes transferred so far by the document and its resources (full page loads)
+TRANSFERRED_BYTES_JS = r"""
+return performance.getEntriesByType("navigation").concat(performance.getEntriesByType("resource"))
+    .reduce((total, entry) => total + (entry.transferSize || 0), 0);
+"""
+
+def apply_lean_profile(options):
+    """
+    Configures Chrome options for lean page loads: 'eager' returns from driver.get once the DOM is
+    ready instead of waiting for every subresource, and images are not decoded.
+    """
+    options.page_load_strategy = "eager"
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    return options
+
+def block_heavy_resources(driver, patterns=None):
+    """
+    Blocks the requests matching 'patterns' (BLOCKED_URL_PATTERNS by default) through CDP.
+    Passing an empty list lifts the block.
+    """
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs",
+                           {"urls": BLOCKED_URL_PATTERNS if patterns is None else patterns})
+
+def extract_listings_in_browser(driver):
+    """
+    Runs EXTRACT_LISTINGS_JS in the loaded page and maps the returned nodes to car records.
+    Returns a tuple: (cars, blocked, transferred, result_bytes, parse_seconds)
+       - cars -> list of car records, or None if the page has no search results payload
+       - blocked -> True if the page is a captcha / block page
+       - transferred -> bytes transferred by the page load
+       - result_bytes -> size of the JSON handed to Python
+       - parse_seconds -> Python-side decoding and mapping time
+    """
+    result = driver.execute_script(EXTRACT_LISTINGS_JS)
+    start = time.perf_counter()
+    data = json_loads(result)
+    cars = None
+    if data["nodes"] is not None:
+        cars = []
+        for node in data["nodes"]:
+            try:
+                cars.append(advert_to_car(node))
+            except Exception as e:
+                print(f"Error parsing listing from JSON: {e}")
+    parse_seconds = time.perf_counter() - start
+    return cars, data["captcha"], data["transferred"], len(result), parse_seconds
+
+class PageLoadStats:
+    """
+    Per-page cost of each load profile ('lean' and 'full'): bytes transferred by the browser,
+    bytes handed to Python, load time and Python-side parse time. Thread-safe.
+    """
+    def __init__(self):
+        self.profiles = {}
+        self.lock = threading.Lock()
+
+    def record(self, profile, transferred, python_bytes, load_seconds, parse_seconds):
+        with self.lock:
+            stats = self.profiles.setdefault(profile, {"pages": 0, "transferred": 0, "python_bytes": 0,
+                                                       "load_seconds": 0.0, "parse_seconds": 0.0})
+            stats["pages"] += 1
+            stats["transferred"] += transferred
+            stats["python_bytes"] += python_bytes
+            stats["load_seconds"] += load_seconds
+            stats["parse_seconds"] += parse_seconds
+
+    def averages(self, profile):
+        stats = self.profiles.get(profile)
+        if not stats or not stats["pages"]:
+            return None
+        pages = stats["pages"]
+        return {key: value / pages for key, value in stats.items() if key != "pages"}
+
+    def report(self):
+        print("[*] Page loads per profile (average per page):")
+        for profile, stats in self.profiles.items():
+            average = self.averages(profile)
+            print(f"    {profile:<5} {stats['pages']:>5} pages  "
+                  f"{average['transferred'] / 1024:>8.0f} KB transferred  "
+                  f"{average['python_bytes'] / 1024:>7.0f} KB to Python  "
+                  f"load {average['load_seconds']:.2f}s  parse {average['parse_seconds'] * 1000:.1f}ms")
+        lean, full = self.averages("lean"), self.averages("full")
+        if lean and full:
+            def ratio(key):
+                return f"{full[key] / lean[key]:.1f}x" if lean[key] else "n/a"
+            print(f"    lean vs full: {ratio('transferred')} fewer bytes transferred, "
+                  f"{ratio('python_bytes')} fewer bytes to Python, {ratio('load_seconds')} faster loads, "
+                  f"{ratio('parse_seconds')} faster parsing")
@@ -2,7 +2,9 @@ import os
 from datetime import datetime
 import time
 import random
-import pandas as pd
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 import undetected_chromedriver as uc
 import psutil
 from selenium.webdriver.common.by import By
@@ -13,6 +15,17 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from scripts.rate_limiter import RateLimiter
+from scripts.rate_controller import RateController
+from scripts.response_classifier import CAPTCHA, LISTINGS
+from scripts.html_parsers import get_backend
+from scripts.extraction_plan import ExtractionPlan
+from scripts.record_sink import RecordSink
+from scripts.probe_cache import ProbeCache, find_last_page
+from scripts.driver_pool import DriverPool, DEFAULT_POOL_SIZE
+from scripts.lean_browser import (
+    TRANSFERRED_BYTES_JS, PageLoadStats, apply_lean_profile, block_heavy_resources, extract_listings_in_browser,
+)
 
 # =====================================
 # ADDITIONAL IMPROVEMENT FUNCTIONS
@@ -34,11 +47,11 @@ def rotate_user_agent(index=None):
     else:
         return random.choice(USER_AGENTS)
 
-def is_captcha_page(soup):
+def is_captcha_page(page_text):
     """
-    Checks if the page contains a message indicating a block (captcha or "too many requests").
+    Checks if the page text contains a message indicating a block (captcha or "too many requests").
     """
-    text = soup.get_text().lower()
+    text = page_text.lower()
     if "captcha" in text or "zbyt wiele zapytań" in text:
         return True
     return False
@@ -74,19 +87,44 @@ options.add_argument("--disable-dev-shm-usage")
 options.add_argument("--window-size=1920,1080")
 # (Optionally, proxy settings can be added if available)
 
-service = Service("C:/WINDOWS/system32/chromedriver.exe")  # Ensure the path is correct
-driver = webdriver.Chrome(service=service, options=options)
-
-# Hide Selenium from detection
-driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-stealth(driver,
-    languages=["pl-PL", "pl"],
-    vendor="Google Inc.",
-    platform="Win32",
-    webgl_vendor="Intel Inc.",
-    renderer="Intel Iris OpenGL Engine",
-    fix_hairline=True,
-)
+# Lean page loads: images, fonts and ad scripts are blocked, driver.get returns once the DOM is ready
+# and the listings are read in the browser from the embedded JSON instead of parsing page_source
+LEAN_MODE = True
+
+# In lean mode, this many pages are loaded the full way first, so the report compares both profiles
+BASELINE_PAGES = 3
+
+if LEAN_MODE:
+    apply_lean_profile(options)
+
+# HTML parser backend used to extract offers: 'html.parser', 'lxml' or 'selectolax'
+PARSER_BACKEND = "html.parser"
+parser = get_backend(PARSER_BACKEND)
+
+CHROMEDRIVER_PATH = "C:/WINDOWS/system32/chromedriver.exe"  # Ensure the path is correct
+
+def create_driver():
+    """ Starts a headless Chrome hidden from detection """
+    service = Service(CHROMEDRIVER_PATH)
+    driver = webdriver.Chrome(service=service, options=options)
+
+    # Hide Selenium from detection
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    stealth(driver,
+        languages=["pl-PL", "pl"],
+        vendor="Google Inc.",
+        platform="Win32",
+        webgl_vendor="Intel Inc.",
+        renderer="Intel Iris OpenGL Engine",
+        fix_hairline=True,
+    )
+    if LEAN_MODE:
+        block_heavy_resources(driver)
+    return driver
+
+# Browsers started once and leased to the workers page by page; each one is restarted after
+# 200 pages or when its processes use more than 1.5 GB
+driver_pool = DriverPool(create_driver, size=DEFAULT_POOL_SIZE)
 
 # =====================================
 # BASE URL
@@ -94,27 +132,44 @@ stealth(driver,
 
 base_url = "https://www.otomoto.pl/osobowe?search%5Bfilter_enum_damaged%5D=0&search%5Badvanced_search_expanded%5D=true"
 
+# Shared request budget for every page load (replaces fixed random sleeps)
+rate_limiter = RateLimiter(requests_per_second=0.25, burst=1, jitter=1.0)
+
+# Slows the page loads down on captchas and speeds them up while pages load cleanly;
+# the learned rate is reused by the next run
+rate_controller = RateController(rate_limiter, state_path="data/selenium_crawl_rate.json", max_rate=1.0)
+
 def wait_for_page_load(driver, timeout=6):
     WebDriverWait(driver, timeout).until(
         EC.presence_of_element_located((By.CSS_SELECTOR, "article[data-id]"))
     )
 
-# =====================================
-# FUNCTION TO DETECT HTML SELECTORS
-# =====================================
-
-def detect_selectors(url):
-    """ Detects current HTML selectors for Otomoto listings """
-    # Set a random User-Agent before loading the page
-    ua = rotate_user_agent()
+def set_user_agent(driver, ua):
     try:
         driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": ua})
     except Exception as e:
         print(f"[!] Error setting User-Agent: {e}")
 
+def load_page(driver, url, timeout=10):
+    """ Loads a page when the rate limiter allows it and waits until the listings are rendered """
+    rate_limiter.acquire()
     driver.get(url)
-    time.sleep(random.uniform(5, 10))  # Delay for safety
-    page_source = driver.page_source
+    try:
+        wait_for_page_load(driver, timeout=timeout)
+    except Exception as e:
+        print(f"[!] Timeout loading page {url}: {e}")
+
+# =====================================
+# FUNCTION TO DETECT HTML SELECTORS
+# =====================================
+
+def detect_selectors(url):
+    """ Detects current HTML selectors for Otomoto listings """
+    with driver_pool.lease() as driver:
+        # Set a random User-Agent before loading the page
+        set_user_agent(driver, rotate_user_agent())
+        load_page(driver, url)
+        page_source = driver.page_source
 
     # Save HTML to a file for debugging
     with open("otomoto_sample.html", "w", encoding="utf-8") as f:
@@ -172,25 +227,62 @@ def detect_selectors(url):
 # FUNCTION TO SPLIT THE BASE URL INTO FILTERED URLS
 # =====================================
 
+# Page counts of the searches, reused by later runs while they are fresh
+probe_cache = ProbeCache("data/probe_cache.json")
+
+def read_total_pages(page_source):
+    """ Returns the highest page number in the pagination widget, or None if there is no pagination """
+    soup = BeautifulSoup(page_source, "html.parser")
+    pagination = soup.find("ul", class_="ooa-1vdlgt7")
+    if pagination:
+        pages = [int(li.text.strip()) for li in pagination.find_all("li") if li.text.strip().isdigit()]
+        if pages:
+            return max(pages)
+    return None
+
+def has_offers(page_source):
+    return bool(parser.select(parser.parse(page_source), "article[data-id]"))
+
+def page_has_offers(url, page):
+    """ Loads a single results page and checks that it lists offers """
+    with driver_pool.lease() as driver:
+        load_page(driver, f"{url}&page={page}")
+        # Pages past the end of the results redirect to another page of the search
+        if page > 1 and f"page={page}" not in driver.current_url:
+            return False
+        page_source = driver.page_source
+    return has_offers(page_source)
+
+def get_total_pages(url):
+    """
+    Returns the number of result pages of a search. The count is cached between runs; if the page
+    has no pagination widget, the last page is found by exponential + binary search.
+    """
+    cached = probe_cache.get(url)
+    if cached is not None:
+        return cached["pages"]
+
+    with driver_pool.lease() as driver:
+        load_page(driver, url)
+        page_source = driver.page_source
+    total_pages = read_total_pages(page_source)
+    requests = 1
+    if total_pages is None:
+        first_page_has_offers = has_offers(page_source)
+        total_pages, requests = find_last_page(
+            lambda page: first_page_has_offers if page == 1 else page_has_offers(url, page), 500)
+    probe_cache.put(url, None, total_pages, requests)
+    return total_pages
+
 def split_link(url):
     """
     Splits the main URL into smaller URLs using a year filter and, if necessary, a gearbox filter.
+    The year ranges are probed in parallel, one per browser of the pool.
     """
-    driver.get(url)
-    time.sleep(random.uniform(5, 10))
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-    
-    total_pages = 0
-    pagination_ul = soup.find("ul", class_="ooa-1vdlgt7")
-    if pagination_ul:
-        page_numbers = [int(li.text.strip()) for li in pagination_ul.find_all("li") if li.text.strip().isdigit()]
-        if page_numbers:
-            total_pages = max(page_numbers)
-    
-    if total_pages <= 500:
+    if get_total_pages(url) <= 500:
         return [url]
     
-    filtered_urls = []
+    year_urls = []
     min_year = 2000
     max_year = datetime.now().year
     for start_year in range(min_year, max_year + 1, 2):
@@ -198,32 +290,18 @@ def split_link(url):
         new_url = url.replace("osobowe", f"osobowe/od-{start_year}", 1)
         if "search%5Bfilter_float_year%3Ato%5D" not in new_url:
             new_url += f"&search%5Bfilter_float_year%3Ato%5D={end_year}"
-        
-        driver.get(new_url)
-        time.sleep(random.uniform(3, 6))
-        soup_new = BeautifulSoup(driver.page_source, "html.parser")
-        total_pages_new = 0
-        pagination_ul_new = soup_new.find("ul", class_="ooa-1vdlgt7")
-        if pagination_ul_new:
-            page_numbers_new = [int(li.text.strip()) for li in pagination_ul_new.find_all("li") if li.text.strip().isdigit()]
-            if page_numbers_new:
-                total_pages_new = max(page_numbers_new)
-        
-        if total_pages_new <= 500:
+        year_urls.append(new_url)
+
+    with ThreadPoolExecutor(max_workers=driver_pool.size) as executor:
+        year_pages = list(executor.map(get_total_pages, year_urls))
+
+    filtered_urls = []
+    for new_url, total_pages in zip(year_urls, year_pages):
+        if total_pages <= 500:
             filtered_urls.append(new_url)
         else:
             for gearbox in ["manual", "automatic"]:
-                gearbox_url = new_url + f"&search%5Bfilter_enum_gearbox%5D={gearbox}"
-                driver.get(gearbox_url)
-                time.sleep(random.uniform(3, 6))
-                soup_gear = BeautifulSoup(driver.page_source, "html.parser")
-                total_pages_gear = 0
-                pagination_ul_gear = soup_gear.find("ul", class_="ooa-1vdlgt7")
-                if pagination_ul_gear:
-                    page_numbers_gear = [int(li.text.strip()) for li in pagination_ul_gear.find_all("li") if li.text.strip().isdigit()]
-                    if page_numbers_gear:
-                        total_pages_gear = max(page_numbers_gear)
-                filtered_urls.append(gearbox_url)
+                filtered_urls.append(new_url + f"&search%5Bfilter_enum_gearbox%5D={gearbox}")
     return filtered_urls
 
 # =====================================
@@ -233,7 +311,7 @@ def split_link(url):
 selectors = detect_selectors(base_url)
 if not selectors:
     print("❌ No selectors detected! Stopping the script.")
-    driver.quit()
+    driver_pool.close()
     exit()
 
 # =====================================
@@ -247,21 +325,140 @@ print(f"✅ Generated {len(filtered_links)} URLs to scrape.")
 # SCRAPING PAGES
 # =====================================
 
-all_data = []
 unique_keys = set()  # Set to store unique offer keys
+unique_keys_lock = threading.Lock()  # The workers share the set
+
+# New offers are written in batches while scraping instead of all at once at the end.
+# The batches go to a new file of this run, which replaces the previous output only once the run
+# has data - a failed or empty run leaves the previous output (and its own flushed batches) in place.
+output_dir = "data"
+if not os.path.exists(output_dir):
+    os.makedirs(output_dir)
+output_file = os.path.join(output_dir, "otomoto_test_ai_agent.csv")
+run_file = os.path.join(output_dir, f"otomoto_test_ai_agent.{datetime.now():%Y%m%d-%H%M%S}.partial.csv")
+sink = RecordSink(batch_size=500)
+
+# Single-pass extraction plan built from the detected selectors. The currency, description and
+# indicator selectors are plain "p", so the matching paragraph is picked by its text.
+extraction_plan = ExtractionPlan(
+    selectors,
+    parser,
+    text_filters={
+        "description": lambda text: "cm3" in text or "KM" in text,
+        "currency": lambda text: "PLN" in text or "EUR" in text,
+        "otomoto_indicator": lambda text: "średniej" in text,
+    },
+    timed=True,
+)
 
-def get_total_pages(url):
-    driver.get(url)
-    time.sleep(random.uniform(3, 6))
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-    pagination = soup.find("ul", class_="ooa-1vdlgt7")
-    if pagination:
-        pages = [int(li.text.strip()) for li in pagination.find_all("li") if li.text.strip().isdigit()]
-        if pages:
-            return max(pages)
-    return 1
+def finish_record(car):
+    """ Normalizes the price and stamps the scraping date """
+    if car["Price"] != "N/A":
+        car["Price"] = car["Price"].replace(" ", "")
+    car["Scraping Date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return car
+
+def extract_offer(offer):
+    """ Extracts a car record from a single offer element with the extraction plan """
+    return finish_record(extraction_plan.extract(offer))
+
+# Bytes, load time and parse time of every page load, per profile
+page_load_stats = PageLoadStats()
+baseline_counter = itertools.count()
+
+def parse_page_source(page_source):
+    """ Today's path: parses the whole page source in Python. Returns (cars, blocked) """
+    document = parser.parse(page_source)
+    if is_captcha_page(parser.page_text(document)):
+        return [], True
+    cars = []
+    for offer in parser.select(document, "article[data-id]"):
+        try:
+            cars.append(extract_offer(offer))
+        except Exception as e:
+            print(f"Error processing offer: {e}")
+    return cars, False
 
-for filtered_link in filtered_links:
+def load_page_records(driver, page_url, lean):
+    """
+    Loads a results page in 'driver' and returns (cars, blocked).
+    The lean profile reads the listings in the browser; the full profile (and the lean one when the
+    page has no JSON payload) waits for the rendered listings and parses the page source.
+    """
+    rate_limiter.acquire()
+    start = time.perf_counter()
+    if not lean and LEAN_MODE:
+        block_heavy_resources(driver, [])
+    try:
+        driver.get(page_url)
+        if lean:
+            cars, blocked, transferred, python_bytes, parse_seconds = extract_listings_in_browser(driver)
+            if cars is not None or blocked:
+                page_load_stats.record("lean", transferred, python_bytes,
+                                       time.perf_counter() - start - parse_seconds, parse_seconds)
+                return [finish_record(car) for car in cars or []], blocked
+
+        try:
+            wait_for_page_load(driver, timeout=6)
+            if not lean:
+                WebDriverWait(driver, 10).until(
+                    lambda d: d.execute_script("return document.readyState") == "complete")
+        except Exception as e:
+            print(f"[!] Timeout loading page {page_url}: {e}")
+        page_source = driver.page_source
+        transferred = driver.execute_script(TRANSFERRED_BYTES_JS) or 0
+    finally:
+        if not lean and LEAN_MODE:
+            block_heavy_resources(driver)
+    load_seconds = time.perf_counter() - start
+
+    parse_start = time.perf_counter()
+    cars, blocked = parse_page_source(page_source)
+    parse_seconds = time.perf_counter() - parse_start
+    page_load_stats.record("lean" if lean else "full", transferred, len(page_source.encode("utf-8")),
+                           load_seconds, parse_seconds)
+    return cars, blocked
+
+def load_cars(page_url, page):
+    """
+    Loads a results page in a leased browser and returns its car records.
+    Retries if no offers or a captcha is detected.
+    """
+    retry_count = 0
+    max_retries = 2
+    while retry_count < max_retries:
+        lean = LEAN_MODE and next(baseline_counter) >= BASELINE_PAGES
+        with driver_pool.lease() as driver:
+            # Set a rotated User-Agent before loading the page
+            set_user_agent(driver, rotate_user_agent(page))
+            try:
+                cars, blocked = load_page_records(driver, page_url, lean)
+            except Exception as e:
+                print(f"[!] Error loading page {page_url}: {e}")
+                cars, blocked = None, False
+
+        if cars is None:
+            retry_count += 1
+            time.sleep(10)
+            continue
+
+        if blocked:
+            rate_controller.record(label=CAPTCHA)
+            print("❗ Captcha detected. Waiting 90 seconds before retrying.")
+            time.sleep(90)
+            retry_count += 1
+            continue
+
+        if not cars:
+            print(f"⚠️ No offers found on page {page_url}. Retrying.")
+            retry_count += 1
+            continue
+        rate_controller.record(label=LISTINGS)
+        return cars  # Offers found, exit retry loop
+    return []
+
+def scrape_link(filtered_link):
+    """ Scrapes the pages of one filtered link (run by the workers, one link per worker) """
     total_pages = get_total_pages(filtered_link)
     MAX_PAGES = 500  # Maximum page limit
     pages_to_scrape = min(total_pages, MAX_PAGES)
@@ -271,145 +468,58 @@ for filtered_link in filtered_links:
     for page in range(1, 3):
         page_url = f"{filtered_link}&page={page}"
         print(f"🔄 Scraping: {page_url}")
-        
-        # Set a rotated User-Agent before loading the page
-        ua = rotate_user_agent(page)
-        try:
-            driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": ua})
-        except Exception as e:
-            print(f"[!] Error setting User-Agent: {e}")
-        
-        # Attempt to load the page – implement retry if no offers or captcha is detected
-        retry_count = 0
-        max_retries = 2
-        offers = []
-        while retry_count < max_retries:
-            try:
-                driver.get(page_url)
-            except Exception as e:
-                print(f"[!] Error loading page {page_url}: {e}")
-                retry_count += 1
-                time.sleep(10)
-                continue
 
-            try:
-                wait_for_page_load(driver, timeout=6)
-            except Exception as e:
-                print(f"[!] Timeout loading page {page_url}: {e}")
-            
-            page_source = driver.page_source
-            soup = BeautifulSoup(page_source, "html.parser")
-            
-            if is_captcha_page(soup):
-                print("❗ Captcha detected. Waiting 90 seconds before retrying.")
-                time.sleep(90)
-                retry_count += 1
-                continue
-            
-            offers = soup.find_all("article", {"data-id": True})
-            if not offers:
-                print(f"⚠️ No offers found on page {page_url}. Retrying in 15 seconds.")
-                time.sleep(15)
-                retry_count += 1
-                continue
-            else:
-                break  # Offers found, exit retry loop
-        
-        if not offers:
-            print(f"⚠️ Skipping page {page_url} after {max_retries} unsuccessful attempts.")
+        cars = load_cars(page_url, page)
+        if not cars:
+            print(f"⚠️ Skipping page {page_url} after unsuccessful attempts.")
             continue
 
-        for offer in offers:
-            try:
-                listing_id = offer.get("data-id", "N/A")
-                
-                title_element = offer.select_one(selectors.get("title", "h2 a"))
-                title = title_element.text.strip() if title_element else "N/A"
-
-                link_element = offer.select_one(selectors.get("link", "h2 a"))
-                link = link_element["href"] if link_element else "N/A"
-
-                price_element = offer.select_one(selectors.get("price", "h3"))
-                price = price_element.text.strip().replace(" ", "") if price_element else "N/A"
-
-                currency_element = offer.find("p", string=lambda text: text and ("PLN" in text or "EUR" in text))
-                currency = currency_element.text.strip() if currency_element else "N/A"
-
-                description_elements = offer.select("p")
-                description = "N/A"
-                for p in description_elements:
-                    text = p.text.strip()
-                    if "cm3" in text or "KM" in text:
-                        description = text
-                        break
-
-                mileage_element = offer.select_one(selectors.get("mileage", "dd[data-parameter='mileage']"))
-                mileage = mileage_element.text.strip() if mileage_element else "N/A"
-
-                fuel_type_element = offer.select_one(selectors.get("fuel_type", "dd[data-parameter='fuel_type']"))
-                fuel_type = fuel_type_element.text.strip() if fuel_type_element else "N/A"
-
-                gearbox_element = offer.select_one(selectors.get("gearbox", "dd[data-parameter='gearbox']"))
-                gearbox = gearbox_element.text.strip() if gearbox_element else "N/A"
-
-                year_element = offer.select_one(selectors.get("year", "dd[data-parameter='year']"))
-                year = year_element.text.strip() if year_element else "N/A"
-
-                location_element = offer.select_one(selectors.get("location", "dl p"))
-                location = location_element.text.strip() if location_element else "N/A"
-
-                seller_type_element = offer.select_one(selectors.get("seller_type", "article li"))
-                seller_type = seller_type_element.text.strip() if seller_type_element else "N/A"
-
-                indicator_element = offer.find("p", string=lambda text: text and "średniej" in text)
-                indicator = indicator_element.text.strip() if indicator_element else "N/A"
-
-                car = {
-                    "ID": listing_id,
-                    "Title": title,
-                    "Link": link,
-                    "Description": description,
-                    "Mileage": mileage,
-                    "Fuel Type": fuel_type,
-                    "Gearbox": gearbox,
-                    "Year": year,
-                    "Location": location,
-                    "Seller Type": seller_type,
-                    "Price": price,
-                    "Currency": currency,
-                    "Otomoto Indicator": indicator,
-                    "Scraping Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-                # Check for duplicates
-                unique_key = create_unique_key(car)
-                if unique_key not in unique_keys:
-                    all_data.append(car)
-                    unique_keys.add(unique_key)
-                else:
-                    print("🔄 Duplicate offer - skipping.")
-            except Exception as e:
-                print(f"Error processing offer: {e}")
+        for car in cars:
+            # Check for duplicates
+            unique_key = create_unique_key(car)
+            with unique_keys_lock:
+                is_new = unique_key not in unique_keys
+                unique_keys.add(unique_key)
+            if is_new:
+                sink.write(run_file, [car])
+            else:
+                print("🔄 Duplicate offer - skipping.")
+
+# The filtered links are spread over the browsers of the pool
+with ThreadPoolExecutor(max_workers=driver_pool.size) as executor:
+    for future in [executor.submit(scrape_link, filtered_link) for filtered_link in filtered_links]:
+        try:
+            future.result()
+        except Exception as e:
+            print(f"[!] Error scraping a filtered link: {e}")
 
 # =====================================
 # SAVE TO CSV
 # =====================================
 
-if all_data:
-    df = pd.DataFrame(all_data)
-    output_dir = "data"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    df.to_csv(os.path.join(output_dir, "otomoto_test_ai_agent.csv"), index=False)
+sink.close()
+if sink.rows_written:
+    os.replace(run_file, output_file)
     print("✅ Scraping complete! Data saved to otomoto_test_ai_agent.csv")
 else:
     print("❌ No data to save. Check the file `otomoto_sample.html`.")
 
+rate_controller.save()
+rate_controller.report()
+rate_limiter.report()
+driver_pool.report()
+page_load_stats.report()
+extraction_plan.report()
+sink.report()
+probe_cache.save()
+probe_cache.report()
+
 # =====================================
 # CLOSE THE BROWSER WITHOUT ERRORS
 # =====================================
 
 try:
-    driver.quit()
+    driver_pool.close()
     time.sleep(2)  # Allow time for complete shutdown
 except Exception as e:
     print(f"⚠️ Error closing Selenium: {e}")
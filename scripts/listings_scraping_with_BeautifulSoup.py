@@ -1,9 +1,21 @@
 import os
 import time
 import random
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import requests
 import pandas as pd
-from bs4 import BeautifulSoup
+from scripts.rate_limiter import RateLimiter
+from scripts.rate_controller import RateController
+from scripts.html_parsers import DEFAULT_BACKEND, get_backend
+from scripts.extraction_plan import ExtractionPlan
+from scripts.next_data import extract_listings_from_json
+from scripts.dedup_store import open_global_dedup
+from scripts.response_archive import ResponseArchive
+from scripts.record_sink import RecordSink
+from scripts.crawl_checkpoints import CrawlCheckpoints
+from scripts.response_classifier import (
+    BLOCK_STATUSES, LISTINGS, EMPTY, CAPTCHA, BLOCK, REDIRECT_LOOP, ResponseClassifier, classify_response,
+)
 
 # List of sample User-Agent strings
 USER_AGENTS = [
@@ -12,6 +24,32 @@ USER_AGENTS = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 12_0_1) AppleWebKit/535.36 (KHTML, like Gecko) Chrome/99.0.4844.51 Safari/535.36",
 ]
 
+# Listing cards of a results page: every card carries the advert ID, while its class names change
+# with every layout (same selector as the Selenium scraper)
+LISTING_SELECTOR = "article[data-id]"
+
+# CSS selectors of the listing fields (same keys as 'detect_selectors' in listing_scraping_Selenium.py)
+LISTING_SELECTORS = {
+    "title": "h2.e4b361b0 a",
+    "link": "h2.e4b361b0 a",
+    "description": "p.ekpvtd0",
+    "mileage": 'dd[data-parameter="mileage"]',
+    "fuel_type": 'dd[data-parameter="fuel_type"]',
+    "gearbox": 'dd[data-parameter="gearbox"]',
+    "year": 'dd[data-parameter="year"]',
+    "location": "dl.ooa-1o0axny p.ooa-oj1jk2",
+    "seller_type": "article.ooa-12g3tpj li",
+    "price": "h3.ecit9451",
+    "currency": "p.ecit9452",
+    "otomoto_indicator": "p.e1gnzfs72",
+}
+
+# Sort order of the incremental mode: newest listings first
+NEWEST_FIRST_ORDER = "created_at_first:desc"
+
+# Compiled extraction plans, one per parser backend
+_extraction_plans = {}
+
 def rotate_user_agent(index=None):
     """
     Returns a User-Agent from the list.
@@ -23,16 +61,35 @@ def rotate_user_agent(index=None):
     else:
         return random.choice(USER_AGENTS)
 
-def is_captcha_page(soup):
+def is_captcha_page(page_text):
     """
-    Checks if the page contains text indicating a "Too many requests" or "captcha" message.
+    Checks if the page text contains a "Too many requests" or "captcha" message.
     If found, it suggests that the scraper has been blocked.
     """
-    text = soup.get_text().lower()
+    text = page_text.lower()
     if "zbyt wiele zapytań" in text or "captcha" in text:
         return True
     return False
 
+def build_headers(user_agent=None):
+    """
+    Returns the HTTP headers sent with every request (User-Agent and language preference).
+    """
+    return {
+        'User-Agent': user_agent if user_agent else random.choice(USER_AGENTS),
+        'Accept-Language': 'pl-PL,pl;q=0.9,en-US;q=0.8,en;q=0.7',
+    }
+
+def newest_first_url(base_url):
+    """
+    Returns 'base_url' with its search sorted by creation date, newest listings first.
+    """
+    parts = urlsplit(base_url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name != "search[order]"]
+    query.append(("search[order]", NEWEST_FIRST_ORDER))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
 def create_unique_key(car):
     """
     Creates a unique key for a car entry based on a combination of fields:
@@ -54,9 +111,71 @@ def create_unique_key(car):
     fields = [str(x).strip() for x in fields]
     return "|".join(fields)
 
-def scrape_page(url, session=None, user_agent=None):
+def get_extraction_plan(backend=DEFAULT_BACKEND):
+    """
+    Returns the (cached) single-pass extraction plan for LISTING_SELECTORS and the given backend.
+    """
+    if backend not in _extraction_plans:
+        _extraction_plans[backend] = ExtractionPlan(LISTING_SELECTORS, get_backend(backend))
+    return _extraction_plans[backend]
+
+def parse_page(html, backend=DEFAULT_BACKEND, plan=None, json_first=True):
+    """
+    Parses the HTML of a single results page and extracts the car listings.
+    - backend: name of the parser backend ('html.parser', 'lxml' or 'selectolax')
+    - plan: ExtractionPlan to use (defaults to the cached plan for LISTING_SELECTORS)
+    - json_first: read the listings from the embedded __NEXT_DATA__ JSON and parse the DOM
+      only if that payload is missing
+    Returns a tuple: (list_of_car_offers, blocked)
+       - list_of_car_offers -> list of dictionaries containing car data
+       - blocked -> True if the server returned a CAPTCHA / block page instead of listings
+    """
+    # The search results are embedded as JSON; reading them skips building the HTML tree
+    if json_first:
+        cars = extract_listings_from_json(html)
+        if cars is not None:
+            return cars, False
+
+    # Parse the page content with the selected backend
+    parser = get_backend(backend)
+    document = parser.parse(html)
+
+    # Check for anti-bot measures like CAPTCHA
+    if is_captcha_page(parser.page_text(document)):
+        return [], True
+
+    # Find all listing articles on the page
+    listings = parser.select(document, LISTING_SELECTOR)
+    cars = []
+
+    if not listings:
+        return [], False
+
+    # Every listing subtree is walked once to fill all the fields
+    if plan is None:
+        plan = get_extraction_plan(backend)
+
+    # Process each listing found on the page
+    for listing in listings:
+        try:
+            cars.append(plan.extract(listing))
+        except Exception as e:
+            print(f"Error parsing listing: {e}")
+
+    return cars, False
+
+def scrape_page(url, session=None, user_agent=None, parser_backend=DEFAULT_BACKEND, json_first=True,
+                archive=None, classifier=None, rate_controller=None):
     """
     Fetches and parses a single page of listings.
+    - parser_backend: name of the HTML parser backend used for extraction
+    - json_first: extract from the embedded __NEXT_DATA__ JSON, falling back to the DOM
+    - archive: ResponseArchive that keeps the raw response; the request is then conditional and
+      an unchanged page (304 Not Modified) is parsed from the archived copy
+    - classifier: ResponseClassifier counting the response classes (optional)
+    - rate_controller: RateController fed with every response, so block signals slow the crawl down
+    The raw response is classified before any parsing; only 'listings' responses are parsed, and
+    only 'listings' and 'empty' responses are archived (never a captcha or block page).
     Returns a tuple: (list_of_car_offers, final_url)
        - list_of_car_offers -> list of dictionaries containing car data
        - final_url -> the actual URL after any potential redirection
@@ -65,10 +184,11 @@ def scrape_page(url, session=None, user_agent=None):
         session = requests
 
     # Prepare HTTP headers with the User-Agent and language preference
-    headers = {
-        'User-Agent': user_agent if user_agent else random.choice(USER_AGENTS),
-        'Accept-Language': 'pl-PL,pl;q=0.9,en-US;q=0.8,en;q=0.7',
-    }
+    headers = build_headers(user_agent)
+
+    # Ask the server to skip the body if the archived copy is still current
+    if archive is not None:
+        headers.update(archive.conditional_headers(url))
 
     # Execute the HTTP GET request
     try:
@@ -79,112 +199,86 @@ def scrape_page(url, session=None, user_agent=None):
 
     final_url = resp.url  # This may be useful if the server performs a redirect
 
-    # Handle HTTP errors
-    if resp.status_code == 404:
-        print(f"[!] 404 Page not found: {url}")
-        return [], final_url
-    if resp.status_code >= 400:
-        print(f"[!] HTTP error {resp.status_code} while fetching {url}")
-        return [], final_url
+    # 429 and server errors tell the controller to slow down (captcha pages are recorded below)
+    if rate_controller is not None and resp.status_code >= 400 and resp.status_code not in BLOCK_STATUSES:
+        rate_controller.record(status=resp.status_code)
+
+    if resp.status_code == 304 and archive is not None:
+        # The page has not changed since the last crawl, so it is parsed from the archive
+        cached = archive.not_modified_response(url, resp.headers)
+        if cached is None:
+            print(f"[!] 304 Not Modified, but {url} is missing from the archive")
+            return [], final_url
+        body, encoding, _ = cached
+        status = 200
+    else:
+        # Handle HTTP errors (block statuses are labelled by the classifier below)
+        if resp.status_code == 404:
+            print(f"[!] 404 Page not found: {url}")
+            return [], final_url
+        if resp.status_code >= 400 and resp.status_code not in BLOCK_STATUSES:
+            print(f"[!] HTTP error {resp.status_code} while fetching {url}")
+            return [], final_url
+
+        body, encoding, status = resp.content, resp.encoding, resp.status_code
+
+    # Label the raw response before any HTML is parsed
+    if classifier is not None:
+        label = classifier.classify(body, status, url, final_url)
+    else:
+        label = classify_response(body, status, url, final_url)
 
-    # Parse the page content with BeautifulSoup
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    # Archive a downloaded page once it is known to be a real results page
+    if archive is not None and resp.status_code != 304 and label in (LISTINGS, EMPTY):
+        archive.store(url, body, encoding, final_url, resp.headers, status)
+    if rate_controller is not None:
+        rate_controller.record(status, label)
 
     # Check for anti-bot measures like CAPTCHA
-    if is_captcha_page(soup):
-        print("[!] CAPTCHA or block detected - taking a longer break (90s).")
+    if label in (CAPTCHA, BLOCK):
+        print(f"[!] {label.upper()} detected - taking a longer break (90s).")
         time.sleep(90)
         return [], final_url
-
-    # Find all listing articles on the page (updated selector for current HTML version)
-    listings = soup.find_all('article', {'class': 'ooa-1yux8sr e1wxlbcc0'})
-    cars = []
-
-    if not listings:
-        snippet = resp.text[:1000]  # Grab a snippet of HTML for debugging
+    if label == REDIRECT_LOOP:
+        print(f"[!] Redirected from {url} to {final_url}")
+        return [], final_url
+    if label == EMPTY:
+        snippet = body[:1000].decode(encoding or "utf-8", errors="replace")  # Grab a snippet of HTML for debugging
         print("[!] No listings found on the page. HTML snippet:", snippet)
         return [], final_url
 
-    # Process each listing found on the page
-    for listing in listings:
-        try:
-            # Extract title and link
-            title_element = listing.select_one('h2.e1n1d04s0 a')
-            title = title_element.text.strip() if title_element else 'N/A'
-            link = title_element['href'] if title_element else 'N/A'
-
-            # Extract description
-            description_element = listing.select_one('p.ewg8vos8')
-            description = description_element.text.strip() if description_element else 'N/A'
-
-            # Extract mileage information
-            mileage_element = listing.select_one('dd[data-parameter="mileage"]')
-            mileage = mileage_element.text.strip() if mileage_element else 'N/A'
-
-            # Extract fuel type
-            fuel_type_element = listing.select_one('dd[data-parameter="fuel_type"]')
-            fuel_type = fuel_type_element.text.strip() if fuel_type_element else 'N/A'
-
-            # Extract gearbox information
-            gearbox_element = listing.select_one('dd[data-parameter="gearbox"]')
-            gearbox = gearbox_element.text.strip() if gearbox_element else 'N/A'
-
-            # Extract year of manufacture
-            year_element = listing.select_one('dd[data-parameter="year"]')
-            year = year_element.text.strip() if year_element else 'N/A'
-
-            # Extract location (first occurrence of the specific element)
-            location_element = listing.select_one('dl.ooa-1o0axny p.ooa-gmxnzj')
-            location = location_element.text.strip() if location_element else 'N/A'
-
-            # Extract seller type
-            seller_type_element = listing.select_one('article.ooa-12g3tpj li')
-            seller_type = seller_type_element.text.strip() if seller_type_element else 'N/A'
-
-            # Extract price
-            price_element = listing.select_one('h3.e6r213i1')
-            price = price_element.text.strip() if price_element else 'N/A'
-
-            # Extract currency information
-            currency_element = listing.select_one('p.e6r213i2')
-            currency = currency_element.text.strip() if currency_element else 'N/A'
-
-            # Extract additional indicator (e.g., "Within average range")
-            indicator_element = listing.select_one('p.elf9i0b2')
-            indicator = indicator_element.text.strip() if indicator_element else 'N/A'
-
-            # Get the listing ID from the data attribute
-            listing_id = listing.get('data-id', 'N/A')
-
-            # Build a dictionary for the car's data
-            car = {
-                'ID': listing_id,
-                'Title': title,
-                'Link': link,
-                'Description': description,
-                'Mileage': mileage,
-                'Fuel Type': fuel_type,
-                'Gearbox': gearbox,
-                'Year': year,
-                'Location': location,
-                'Seller Type': seller_type,
-                'Price': price,
-                'Currency': currency,
-                'Otomoto Indicator': indicator
-            }
-            cars.append(car)
-
-        except Exception as e:
-            print(f"Error parsing listing: {e}")
-
+    html = body.decode(encoding or "utf-8", errors="replace")
+    cars, blocked = parse_page(html, backend=parser_backend, json_first=json_first)
+    if blocked:
+        print("[!] CAPTCHA or block detected - taking a longer break (90s).")
+        time.sleep(90)
+        return [], final_url
     return cars, final_url
 
-def scrape_multiple_links(base_urls, output_dir, max_pages=500):
+def scrape_multiple_links(base_urls, output_dir, max_pages=500, rate_limiter=None,
+                          parser_backend=DEFAULT_BACKEND, json_first=True, archive_dir=None,
+                          output_format="csv", resume=True, incremental=False, page_counts=None,
+                          adaptive_rate=True, browser_session=None):
     """
     Main function to scrape multiple base URLs.
     - base_urls: list of starting URLs
     - output_dir: directory where CSV files will be saved
     - max_pages: maximum number of pages to scrape per base URL
+    - rate_limiter: RateLimiter pacing the requests (a default one is created if not provided)
+    - parser_backend: HTML parser backend ('html.parser', 'lxml' or 'selectolax')
+    - json_first: extract from the embedded __NEXT_DATA__ JSON, falling back to the DOM
+    - archive_dir: directory of the raw response archive (None disables archiving)
+    - output_format: 'csv', 'csv.gz' or 'parquet'
+    - resume: continue an interrupted crawl from its checkpoints (finished base URLs are skipped)
+    - incremental: crawl every base URL newest-first and stop it at the first page whose listing IDs
+      are all known already (the rest of the base URL has not changed since the last run)
+    - page_counts: optional {base_url: number of pages}, used to record the pages skipped in
+      incremental mode (defaults to max_pages)
+    - adaptive_rate: adjust the request rate to the block signals of the site (AIMD); the learned
+      rate is saved in output_dir and the next crawl starts from it
+    - browser_session: BrowserSession for the hybrid mode - a browser gets past the consent banner and
+      its cookies / User-Agent are handed to the HTTP session, which does the pagination; the browser
+      is started again only when the session expires or a captcha / block page is returned
     """
     # Ensure that the output directory exists; if not, create it
     if not os.path.exists(output_dir):
@@ -194,57 +288,86 @@ def scrape_multiple_links(base_urls, output_dir, max_pages=500):
     # Initialize a requests session to persist cookies and other settings
     session = requests.Session()
 
+    # One dedup service for the whole crawl, so offers listed under several base URLs are saved once
+    dedup_store = open_global_dedup(output_dir)
+
+    # Progress of every base URL, so an interrupted crawl resumes where it stopped
+    checkpoints = CrawlCheckpoints(os.path.join(output_dir, "crawl_checkpoint.json"), base_urls, resume=resume)
+
+    def commit_progress():
+        # The flushed records are on disk now, so their digests and pages can be made durable
+        dedup_store.commit()
+        checkpoints.save()
+        if rate_controller is not None:
+            rate_controller.save()
+
+    # Buffer the new records and write them in batches; the dedup digests and checkpoints are saved
+    # after every flush, so a crash never marks records that were still in the buffer as seen
+    sink = RecordSink(output_format, checkpoint_path=os.path.join(output_dir, "sink_checkpoint.json"),
+                      on_flush=commit_progress)
+
+    # Pace the requests with a token bucket instead of fixed sleeps
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+
+    # Slow down on captchas / 429 / 5xx and speed up while the responses stay clean
+    rate_controller = None
+    if adaptive_rate:
+        rate_controller = RateController(rate_limiter, state_path=os.path.join(output_dir, "crawl_rate.json"))
+
+    # Keep the raw responses, so repeat crawls can send conditional requests
+    archive = ResponseArchive(archive_dir) if archive_dir else None
+
+    # Counts the class of every response (listings, empty, captcha, block, redirect-loop)
+    classifier = ResponseClassifier()
+
     # Process each base URL one by one
     for idx, base_url in enumerate(base_urls, 1):
+        if checkpoints.is_finished(base_url):
+            print(f"\n[*] Skipping finished base URL: {base_url}")
+            continue
         print(f"\n[*] Start scraping from: {base_url}")
 
-        # Define a unique CSV file for this base URL
-        output_file = os.path.join(output_dir, f"otomoto_listings_{idx}.csv")
-
-        # Load existing records and build a set of unique keys to avoid duplicates
-        all_unique_keys = set()
-        if os.path.exists(output_file):
-            existing_data = pd.read_csv(output_file)
-            print(f"Loaded {len(existing_data)} rows from {output_file}.")
-
-            # Replace missing values with empty strings for consistency
-            existing_data.fillna('', inplace=True)
-            for _, row in existing_data.iterrows():
-                car = {
-                    'Title': row.get('Title', ''),
-                    'Description': row.get('Description', ''),
-                    'Mileage': row.get('Mileage', ''),
-                    'Fuel Type': row.get('Fuel Type', ''),
-                    'Gearbox': row.get('Gearbox', ''),
-                    'Year': row.get('Year', ''),
-                    'Location': row.get('Location', ''),
-                    'Seller Type': row.get('Seller Type', ''),
-                    'Price': row.get('Price', '')
-                }
-                unique_key = create_unique_key(car)
-                all_unique_keys.add(unique_key)
-
-            print(f"Unique records in memory: {len(all_unique_keys)}")
-        else:
-            print("[!] Output file not found, starting fresh.")
+        # Resume after the last completed page of an interrupted crawl
+        start_page = checkpoints.start_page(base_url)
+        if start_page > 1:
+            print(f"  -> Resuming at page {start_page}.")
+
+        # In incremental mode the newest listings come first
+        crawl_url = newest_first_url(base_url) if incremental else base_url
+
+        # Define a unique output file for this base URL
+        output_file = sink.output_path(os.path.join(output_dir, f"otomoto_listings_{idx}"))
 
         # Variable to track if the page URL has not changed (indicating a possible redirect loop)
         last_final_url = None
         repeat_url_count = 0
 
         # Counter for consecutive pages with no new offers
-        consecutive_empty_pages = 0
+        consecutive_empty_pages = checkpoints.get(base_url)["consecutive_empty_pages"]
 
         # Loop through pages up to max_pages
-        for page_number in range(1, max_pages + 1):
-            page_url = f"{base_url}&page={page_number}"
+        for page_number in range(start_page, max_pages + 1):
+            page_url = f"{crawl_url}&page={page_number}"
             print(f"Scraping: {page_url} [page {page_number}/{max_pages}]")
 
-            # Rotate user-agent based on the page number
-            user_agent = rotate_user_agent(index=page_number)
+            # Rotate user-agent based on the page number (the bootstrapped session keeps the browser's one)
+            if browser_session is not None:
+                user_agent = browser_session.apply(session)
+                block_signals = classifier.counts[CAPTCHA] + classifier.counts[BLOCK]
+            else:
+                user_agent = rotate_user_agent(index=page_number)
+
+            # Wait for the rate limiter, then scrape the page and retrieve car listings and the final URL
+            rate_limiter.acquire()
+            cars, final_url = scrape_page(page_url, session=session, user_agent=user_agent,
+                                          parser_backend=parser_backend, json_first=json_first,
+                                          archive=archive, classifier=classifier,
+                                          rate_controller=rate_controller)
 
-            # Scrape the page and retrieve car listings and the final URL
-            cars, final_url = scrape_page(page_url, session=session, user_agent=user_agent)
+            # A captcha / block page means the bootstrapped session is no longer accepted
+            if browser_session is not None and classifier.counts[CAPTCHA] + classifier.counts[BLOCK] > block_signals:
+                browser_session.expire()
 
             # Check if the final URL is the same as the previous one
             if final_url == last_final_url:
@@ -262,83 +385,122 @@ def scrape_multiple_links(base_urls, output_dir, max_pages=500):
             # If no car listings are found on the page
             if not cars:
                 if consecutive_empty_pages == 0:
-                    # Try a short retry if it's the first empty page
+                    # Give it one more page if it's the first empty page
                     consecutive_empty_pages += 1
-                    print("[!] Empty page – retrying after a short break (15s).")
-                    time.sleep(15)
+                    print("[!] Empty page – trying the next one.")
+                    checkpoints.complete_page(base_url, page_number, 0, consecutive_empty_pages)
                     continue
                 else:
                     # If two empty pages in a row, stop scraping this base URL
                     print(f"[!] No more cars found at page {page_number}. Moving to next URL.")
                     break
 
-            # Check for uniqueness of each car listing using the unique key
-            new_cars = []
-            for car in cars:
-                unique_key = create_unique_key(car)
-                if unique_key not in all_unique_keys:
-                    new_cars.append(car)
-                    all_unique_keys.add(unique_key)
+            # Incremental mode: a page that lists only known IDs means the older pages are unchanged too
+            if incremental:
+                known_ids = dedup_store.known_ids(car['ID'] for car in cars)
+                if all(car['ID'] in known_ids for car in cars):
+                    total_pages = min((page_counts or {}).get(base_url) or max_pages, max_pages)
+                    pages_skipped = max(total_pages - page_number, 0)
+                    print(f"[*] Page {page_number} lists only known offers - skipping the remaining "
+                          f"{pages_skipped} pages.")
+                    checkpoints.complete_page(base_url, page_number, 0, consecutive_empty_pages)
+                    checkpoints.record_skipped(base_url, pages_skipped)
+                    break
+
+            # Check for uniqueness of each car listing using the digest of its unique key
+            new_cars = dedup_store.filter_new(cars)
 
-            # If there are new unique records, append them to the CSV file
+            # If there are new unique records, hand them to the sink
             if new_cars:
-                new_df = pd.DataFrame(new_cars)
-                if os.path.exists(output_file):
-                    new_df.to_csv(output_file, mode='a', header=False, index=False)
-                else:
-                    new_df.to_csv(output_file, index=False)
+                try:
+                    sink.write(output_file, new_cars)
+                except Exception:
+                    dedup_store.rollback()
+                    raise
 
-                print(f"  -> Added {len(new_cars)} new records. Total unique records: {len(all_unique_keys)}")
+                print(f"  -> Added {len(new_cars)} new records. Total unique records: {len(dedup_store)}")
                 consecutive_empty_pages = 0  # Reset the empty pages counter since we found new offers
             else:
                 consecutive_empty_pages += 1
                 print(f"  -> No new unique records on this page (streak={consecutive_empty_pages}).")
-                if consecutive_empty_pages >= 3:
-                    print("[!] Three consecutive pages without new offers. Moving to the next base URL.")
-                    break
 
-            # Wait for a random short period to reduce the risk of being blocked
-            sleep_time = random.uniform(3, 5)
-            print(f"Sleeping {sleep_time:.1f} sec...")
-            time.sleep(sleep_time)
+            checkpoints.complete_page(base_url, page_number, len(new_cars), consecutive_empty_pages)
+            if consecutive_empty_pages >= 3:
+                print("[!] Three consecutive pages without new offers. Moving to the next base URL.")
+                break
 
+        checkpoints.finish(base_url)
         print(f"Done with base URL: {base_url}")
 
+    sink.close()
+    sink.report()
+    checkpoints.save()
+    checkpoints.report()
+    dedup_store.close()
+    dedup_store.report()
+    if archive is not None:
+        archive.evict()
+        archive.report()
+        archive.close()
+    classifier.report()
+    if rate_controller is not None:
+        rate_controller.save()
+        rate_controller.report()
+    if browser_session is not None:
+        browser_session.report()
+    rate_limiter.report()
     print("All base URLs have been processed.")
 
-if __name__ == "__main__":
-    # List of base URLs to scrape (you only need to define them once here)
-    base_urls = [
-        'https://www.otomoto.pl/osobowe/abarth--acura--aiways--aixam--alfa-romeo--alpina--alpine--arcfox--asia--aston-martin--austin--autobianchi--avatr--baic--bentley--brilliance--bugatti--buick--byd--cadillac--casalini--caterham--cenntro--changan--chatenet--chevrolet--chrysler--citroen--cupra?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/audi?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=automatic&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/audi?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=manual&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/bmw?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_fuel_type%5D%5B0%5D=petrol-cng&search%5Bfilter_enum_fuel_type%5D%5B1%5D=petrol-lpg&search%5Bfilter_enum_fuel_type%5D%5B2%5D=diesel&search%5Bfilter_enum_fuel_type%5D%5B3%5D=electric&search%5Bfilter_enum_fuel_type%5D%5B4%5D=etanol&search%5Bfilter_enum_fuel_type%5D%5B5%5D=hybrid&search%5Bfilter_enum_fuel_type%5D%5B6%5D=plugin-hybrid&search%5Bfilter_enum_fuel_type%5D%5B7%5D=hidrogen&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/bmw?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_fuel_type%5D=petrol&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/dacia--daewoo--daihatsu--delorean--dfm--dfsk--dkw--dodge--doosan--dr-motor--ds-automobiles--e-go--elaris--faw--fendt--ferrari--fiat--fisker?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/ford?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=manual&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/ford?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=automatic&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/forthing--gaz--geely--genesis--gmc--gwm--hiphi--honda--hongqi--hummer--hyundai--iamelectric--ineos--infiniti--isuzu--iveco--jac--jaecoo--jaguar--inny?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/jeep--jetour--jinpeng--kia--ktm--lada--lamborghini--lancia--land-rover--leapmotor--levc?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/lexus--ligier--lincoln--lixiang--lotus--lti--lucid--lynk-and-co--man--maserati--maximus--maxus--maybach--mazda--mclaren--mercury--mg--microcar--mini--mitsubishi--morgan--nio?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/mercedes-benz?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=automatic&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/mercedes-benz?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=manual&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/nissan--nysa--oldsmobile--omoda--piaggio--plymouth--polestar--polonez--pontiac--porsche--ram?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/opel?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=automatic&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/opel?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=manual&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/peugeot?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/renault--rolls-royce--rover--saab--sarini--saturn?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/seat--seres--shuanghuan--skywell--skyworth--smart--ssangyong--subaru--suzuki--syrena--tarpan--tata--tesla?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/skoda?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/toyota?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/trabant--triumph--uaz--vauxhall--velex--volvo--voyah--waltra--marka_warszawa--wartburg--wolga--xiaomi--xpeng--zaporozec--zastawa--zeekr--zhidou--zuk?search%5Bfilter_enum_damaged%5D=0&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/volkswagen?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=manual&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true',
-        'https://www.otomoto.pl/osobowe/volkswagen?search%5Bfilter_enum_damaged%5D=0&search%5Bfilter_enum_gearbox%5D=automatic&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true'
-    ]
+def reparse_archive(archive_dir, output_file, parser_backend=DEFAULT_BACKEND, json_first=True):
+    """
+    Re-extracts the listings from the latest archived copy of every page (e.g. after the
+    selectors were fixed) and writes the unique records to 'output_file', without crawling again.
+    Returns the number of records written.
+    """
+    archive = ResponseArchive(archive_dir)
+    cars_by_key = {}
+    for url, body, encoding, _ in archive.iter_latest():
+        cars, blocked = parse_page(body.decode(encoding or "utf-8", errors="replace"),
+                                   backend=parser_backend, json_first=json_first)
+        if blocked:
+            print(f"[!] Archived page is a CAPTCHA / block page: {url}")
+        for car in cars:
+            cars_by_key.setdefault(create_unique_key(car), car)
+    archive.close()
+
+    if cars_by_key:
+        pd.DataFrame(list(cars_by_key.values())).to_csv(output_file, index=False)
+    print(f"Re-parsed {len(cars_by_key)} unique records from {archive_dir} into {output_file}.")
+    return len(cars_by_key)
 
+if __name__ == "__main__":
     # Directory where CSV files will be saved
     output_dir = "data/otomoto_listings"
 
+    # Directory of the raw response archive
+    archive_dir = "data/otomoto_archive"
+
     # Maximum number of pages to scrape per base URL
     max_pages = 500
 
-    scrape_multiple_links(base_urls, output_dir, max_pages)
\ No newline at end of file
+    # Daily refresh: crawl newest-first and stop every base URL at the first page of known listings
+    incremental = False
+
+    # Hybrid mode: bootstrap the cookies in a browser, then paginate over plain HTTP
+    hybrid = False
+
+    # Split the search into shards that fit under the page cap
+    from scripts.shard_planner import DEFAULT_CACHE_PATH, plan_shards
+    from scripts.probe_cache import ProbeCache
+    shards = plan_shards(cache=ProbeCache(DEFAULT_CACHE_PATH))
+    base_urls = [shard.url for shard in shards]
+    page_counts = {shard.url: shard.pages for shard in shards}
+
+    browser_session = None
+    if hybrid:
+        from scripts.browser_session import BrowserSession
+        browser_session = BrowserSession()
+
+    scrape_multiple_links(base_urls, output_dir, max_pages, archive_dir=archive_dir,
+                          incremental=incremental, page_counts=page_counts,
+                          browser_session=browser_session)
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+
+# orjson is several times faster than the standard library; fall back to json if it is not installed
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+NEXT_DATA_START = '<script id="__NEXT_DATA__"'
+SCRIPT_END = '</script>'
+
+# Marker of the urqlState entry that holds the search results (not the filter definitions)
+ADVERT_SEARCH_MARKER = '"advertSearch":'
+
+# Price evaluation codes mapped to the texts shown on the listing cards
+PRICE_INDICATORS = {
+    "BELOW": "Poniżej średniej",
+    "IN": "W granicach średniej",
+    "ABOVE": "Powyżej średniej",
+}
+
+def find_next_data(html):
+    """
+    Returns the raw JSON text (str or bytes, like 'html') of the __NEXT_DATA__ script,
+    or None if the page does not contain it. Uses plain substring search, no HTML parsing.
+    """
+    if isinstance(html, bytes):
+        start_marker, end_marker, tag_end = NEXT_DATA_START.encode(), SCRIPT_END.encode(), b">"
+    else:
+        start_marker, end_marker, tag_end = NEXT_DATA_START, SCRIPT_END, ">"
+
+    start = html.find(start_marker)
+    if start == -1:
+        return None
+    start = html.find(tag_end, start) + 1
+    end = html.find(end_marker, start)
+    if start == 0 or end == -1:
+        return None
+    return html[start:end]
+
+def find_advert_search(next_data):
+    """
+    Decodes the __NEXT_DATA__ payload and returns the 'advertSearch' object from urqlState, or None.
+    Only the urqlState entry that contains the search results is decoded a second time.
+    """
+    try:
+        payload = json_loads(next_data)
+        urql_state = payload["props"]["pageProps"]["urqlState"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    for entry in urql_state.values():
+        data = entry.get("data") if isinstance(entry, dict) else None
+        if not data or ADVERT_SEARCH_MARKER not in data:
+            continue
+        try:
+            return json_loads(data)["advertSearch"]
+        except (ValueError, KeyError, TypeError):
+            return None
+    return None
+
+def format_price(amount):
+    """
+    Formats a price like the listing cards do: 24800 -> '24 800'.
+    """
+    units = amount.get("units")
+    if units is None:
+        return amount.get("value") or "N/A"
+    return f"{int(units):,}".replace(",", " ")
+
+# Texts of the seller line on the listing cards
+DEALER_TEXT = "Firma"
+PRIVATE_SELLER_TEXT = "Prywatny sprzedawca"
+SELLER_PAGE_TEXT = "Zobacz ogłoszenia"
+
+def seller_type_text(node):
+    """
+    Returns the seller line of the listing card exactly as the DOM scrapers read it (the text of
+    the first item of the seller box), so JSON and DOM records get the same 'Seller Type' and the
+    same dedup key:
+    - the brand program (if the advert has one) or else the seller is shown as its logo, which has
+      no text, or as "Firma" (dealer) / "Prywatny sprzedawca" (private seller)
+    - a link to its page follows as "Zobacz ogłoszenia"
+    E.g. 'FirmaZobacz ogłoszenia' for a dealer with a page but no logo.
+    """
+    brand_program = node.get("brandProgram") or {}
+    if brand_program.get("searchUrl"):
+        text = "" if brand_program.get("logo") else (brand_program.get("name") or "").strip()
+        return text + SELLER_PAGE_TEXT
+
+    # Dealers have a name, private sellers do not
+    seller_link = node.get("sellerLink") or {}
+    if seller_link.get("logo"):
+        text = ""
+    elif seller_link.get("name"):
+        text = DEALER_TEXT
+    else:
+        text = PRIVATE_SELLER_TEXT
+    if seller_link.get("websiteUrl"):
+        text += SELLER_PAGE_TEXT
+    return text or 'N/A'
+
+def advert_to_car(node):
+    """
+    Maps an advert node from the search results to the record schema used by the scrapers.
+    """
+    parameters = {
+        parameter["key"]: (parameter.get("displayValue") or "").strip()
+        for parameter in node.get("parameters") or []
+    }
+
+    # The card description is "<engine capacity> • <engine power> • <short description>"
+    description_parts = [
+        parameters.get("engine_capacity"),
+        parameters.get("engine_power"),
+        (node.get("shortDescription") or "").strip(),
+    ]
+    description = " • ".join(part for part in description_parts if part)
+
+    location = node.get("location") or {}
+    city = (location.get("city") or {}).get("name")
+    region = (location.get("region") or {}).get("name")
+    if city and region:
+        location_text = f"{city} ({region})"
+    else:
+        location_text = city or region or "N/A"
+
+    price = node.get("price") or {}
+    amount = price.get("amount") or {}
+    evaluation = (node.get("priceEvaluation") or {}).get("indicator")
+
+    return {
+        'ID': node.get("id") or 'N/A',
+        'Title': (node.get("title") or "").strip() or 'N/A',
+        'Link': node.get("url") or 'N/A',
+        'Description': description or 'N/A',
+        'Mileage': parameters.get("mileage") or 'N/A',
+        'Fuel Type': parameters.get("fuel_type") or 'N/A',
+        'Gearbox': parameters.get("gearbox") or 'N/A',
+        'Year': parameters.get("year") or 'N/A',
+        'Location': location_text,
+        'Seller Type': seller_type_text(node),
+        'Price': format_price(amount) if amount else 'N/A',
+        'Currency': amount.get("currencyCode") or 'N/A',
+        'Otomoto Indicator': PRICE_INDICATORS.get(evaluation, 'N/A'),
+    }
+
+def extract_listings_from_json(html):
+    """
+    JSON-first extraction: reads the listings from the __NEXT_DATA__ / urqlState payload.
+    Accepts the page as str or bytes.
+    Returns the list of car records, or None if the page has no search results payload
+    (the caller should then fall back to DOM parsing).
+    """
+    next_data = find_next_data(html)
+    if next_data is None:
+        return None
+
+    advert_search = find_advert_search(next_data)
+    if advert_search is None:
+        return None
+
+    cars = []
+    for edge in advert_search.get("edges") or []:
+        node = edge.get("node")
+        if not node:
+            continue
+        try:
+            cars.append(advert_to_car(node))
+        except Exception as e:
+            print(f"Error parsing listing from JSON: {e}")
+    return cars
@@ -0,0 +1,106 @@
+import time
+import threading
+from scripts.record_sink import read_json, write_json_atomic
+
+# Page counts older than this are probed again
+DEFAULT_TTL_HOURS = 24
+
+class ProbeCache:
+    """
+    Result counts and page counts of search URLs, kept between runs for 'ttl_hours', so repeat
+    runs of the shard planner (or the Selenium 'get_total_pages') do not probe searches again.
+    Every entry remembers how many requests its probe took, which is what a cache hit saves.
+    """
+    def __init__(self, path, ttl_hours=DEFAULT_TTL_HOURS):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.entries = read_json(path, {})
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.saved_requests = 0
+        self.probe_requests = 0
+
+    def get(self, url):
+        """
+        Returns the cached {'total_count', 'pages', 'probed_at', 'requests'} of 'url',
+        or None if it is missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None or time.time() - entry["probed_at"] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_requests += entry["requests"]
+            return entry
+
+    def put(self, url, total_count, pages, requests):
+        with self.lock:
+            self.entries[url] = {
+                "total_count": total_count,
+                "pages": pages,
+                "probed_at": time.time(),
+                "requests": requests,
+            }
+            self.probe_requests += requests
+
+    def save(self):
+        with self.lock:
+            # Expired entries are dropped, so the file does not grow with every plan
+            now = time.time()
+            self.entries = {url: entry for url, entry in self.entries.items()
+                            if now - entry["probed_at"] <= self.ttl_seconds}
+            write_json_atomic(self.path, self.entries)
+
+    def report(self):
+        print(f"[*] Probe cache: {self.hits} searches reused, {self.misses} probed "
+              f"({self.probe_requests} requests), {self.saved_requests} probe requests saved.")
+
+def last_page_search(page_cap):
+    """
+    Finds the last results page when the page count cannot be read: pages 1, 2, 4, 8, ... are
+    probed until one is empty, then the gap is narrowed by binary search - about 2 * log2(pages)
+    requests instead of walking every page.
+    Generator: yields the page numbers to probe and must be sent back whether each page has
+    listings. Returns the last page (0 if there are no results, page_cap + 1 if it is over the cap).
+    """
+    if not (yield 1):
+        return 0
+
+    # Exponential search for the first empty page
+    low, high = 1, None
+    while high is None:
+        page = min(low * 2, page_cap + 1)
+        if (yield page):
+            low = page
+            if page > page_cap:
+                return page
+        else:
+            high = page
+
+    # Binary search between the last page with listings and the first empty one
+    while high - low > 1:
+        middle = (low + high) // 2
+        if (yield middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+def find_last_page(page_has_listings, page_cap):
+    """
+    Runs 'last_page_search' with the synchronous check 'page_has_listings(page)'.
+    Returns (last_page, requests).
+    """
+    search = last_page_search(page_cap)
+    requests = 0
+    try:
+        page = next(search)
+        while True:
+            requests += 1
+            page = search.send(page_has_listings(page))
+    except StopIteration as stop:
+        return stop.value, requests
@@ -0,0 +1,153 @@
+import time
+import threading
+from collections import deque
+from scripts.record_sink import read_json, write_json_atomic
+from scripts.response_classifier import CAPTCHA, BLOCK
+
+# Bounds of the crawl rate (requests per second)
+DEFAULT_MIN_RATE = 0.05
+DEFAULT_MAX_RATE = 4.0
+
+# Additive increase: the rate grows by 'increase_step' after every 'increase_interval' clean responses
+DEFAULT_INCREASE_STEP = 0.05
+DEFAULT_INCREASE_INTERVAL = 20
+
+# Multiplicative decrease applied on a block signal
+DEFAULT_DECREASE_FACTOR = 0.5
+
+# Block signals within this many seconds of a decrease count as the same episode
+# (requests already in flight are answered with the same captcha)
+DEFAULT_DECREASE_COOLDOWN = 30.0
+
+# Number of recent responses used for the error ratio
+DEFAULT_WINDOW = 100
+
+# Status codes that mean the crawl is too fast
+THROTTLE_STATUSES = {429}
+
+def is_block_signal(status=None, label=None):
+    """
+    Returns True if a response tells the crawler to slow down:
+    a captcha / block page, status 429 or a server error (5xx).
+    """
+    if label in (CAPTCHA, BLOCK):
+        return True
+    return status is not None and (status in THROTTLE_STATUSES or status >= 500)
+
+class RateController:
+    """
+    AIMD (additive increase, multiplicative decrease) controller of a RateLimiter's request rate.
+    Every response is fed to 'record': a block signal (captcha, block page, 429, 5xx) multiplies the
+    rate by 'decrease_factor', while a streak of 'increase_interval' clean responses adds
+    'increase_step'. The crawl settles just under the rate the site starts blocking at.
+    - rate_limiter: RateLimiter whose rate is controlled
+    - state_path: JSON file keeping the learned rate between runs (None disables it); when it exists,
+      the crawl starts from the saved rate instead of the limiter's own
+    - min_rate / max_rate: bounds of the rate
+    - window: number of recent responses used for the error ratio
+    The controller is thread-safe, like the limiter.
+    """
+    def __init__(self, rate_limiter, state_path=None, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 increase_step=DEFAULT_INCREASE_STEP, increase_interval=DEFAULT_INCREASE_INTERVAL,
+                 decrease_factor=DEFAULT_DECREASE_FACTOR, decrease_cooldown=DEFAULT_DECREASE_COOLDOWN,
+                 window=DEFAULT_WINDOW):
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+        self.rate_limiter = rate_limiter
+        self.state_path = state_path
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.increase_interval = increase_interval
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.recent = deque(maxlen=window)
+        self.clean_streak = 0
+        self.last_decrease = None
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.responses = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+
+        state = read_json(state_path) if state_path else None
+        rate = state["rate"] if state is not None else rate_limiter.requests_per_second
+        self.rate = self._bounded(rate)
+        self.initial_rate = self.rate
+        self.rate_limiter.set_rate(self.rate)
+        if state is not None:
+            print(f"[*] Starting at the learned crawl rate of {self.rate:.2f} req/s ({state_path}).")
+
+    def _bounded(self, rate):
+        return min(self.max_rate, max(self.min_rate, rate))
+
+    def record(self, status=None, label=None):
+        """
+        Feeds one response to the controller: its HTTP status and/or its response class.
+        Returns True if it was a block signal.
+        """
+        blocked = is_block_signal(status, label)
+        with self.lock:
+            self.responses += 1
+            self.recent.append(blocked)
+            now = time.monotonic()
+            if blocked:
+                self.errors += 1
+                self.clean_streak = 0
+                if self.last_decrease is None or now - self.last_decrease >= self.decrease_cooldown:
+                    self.last_decrease = now
+                    self.decreases += 1
+                    self._set_rate(self.rate * self.decrease_factor)
+            else:
+                self.clean_streak += 1
+                if self.clean_streak >= self.increase_interval:
+                    self.clean_streak = 0
+                    self.increases += 1
+                    self._set_rate(self.rate + self.increase_step)
+        return blocked
+
+    def _set_rate(self, rate):
+        rate = self._bounded(rate)
+        if rate != self.rate:
+            self.rate = rate
+            self.rate_limiter.set_rate(rate)
+
+    def error_ratio(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def stats(self):
+        """
+        Returns the controller metrics: current rate, recent error ratio and the adjustments made.
+        """
+        with self.lock:
+            return {
+                "rate": self.rate,
+                "initial_rate": self.initial_rate,
+                "error_ratio": self.error_ratio(),
+                "responses": self.responses,
+                "errors": self.errors,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+    def save(self):
+        """
+        Saves the learned rate, so the next crawl starts from it.
+        """
+        if not self.state_path:
+            return
+        stats = self.stats()
+        write_json_atomic(self.state_path, {
+            "rate": stats["rate"],
+            "error_ratio": stats["error_ratio"],
+            "updated_at": time.time(),
+        })
+
+    def report(self):
+        stats = self.stats()
+        print(f"[*] Rate controller: {stats['initial_rate']:.2f} -> {stats['rate']:.2f} req/s, "
+              f"{stats['errors']}/{stats['responses']} block signals "
+              f"(recent error ratio {stats['error_ratio']:.1%}), "
+              f"{stats['increases']} increases, {stats['decreases']} decreases.")
@@ -0,0 +1,109 @@
+import time
+import random
+import asyncio
+import threading
+
+# Default request budget shared by the scrapers
+DEFAULT_REQUESTS_PER_SECOND = 0.5
+DEFAULT_BURST = 2
+DEFAULT_JITTER = 0.5
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by all requests of a crawl.
+    - requests_per_second: long-term request budget (tokens added per second)
+    - burst: maximum number of requests that can be sent back-to-back after an idle period
+    - jitter: maximum random delay (in seconds) added to every request to avoid a regular pattern
+    The limiter is thread-safe and can be used from synchronous code (acquire) and from
+    asyncio code (acquire_async). It keeps track of how much time callers spent waiting on it.
+    """
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST,
+                 jitter=DEFAULT_JITTER):
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.requests_per_second = float(requests_per_second)
+        self.burst = burst
+        self.jitter = jitter
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _reserve(self):
+        """
+        Takes one token from the bucket and returns how long the caller has to wait before sending
+        its request. Tokens may go negative, which queues callers fairly one after another.
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.updated_at
+            self.tokens = min(self.burst, self.tokens + elapsed * self.requests_per_second)
+            self.updated_at = now
+
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.requests_per_second
+            if self.jitter:
+                wait += random.uniform(0, self.jitter)
+
+            self.requests += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def acquire(self):
+        """
+        Blocks until the next request is allowed. Returns the time spent waiting (in seconds).
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        """
+        Asyncio version of 'acquire' - waits without blocking the event loop.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def set_rate(self, requests_per_second):
+        """
+        Changes the request budget; tokens accumulated so far are kept.
+        """
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second must be positive")
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.requests_per_second)
+            self.updated_at = now
+            self.requests_per_second = float(requests_per_second)
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of requests and the time spent waiting on the limiter.
+        """
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "total_wait": self.total_wait,
+                "average_wait": self.total_wait / self.requests if self.requests else 0.0,
+                "max_wait": self.max_wait,
+                "requests_per_second": self.requests_per_second,
+            }
+
+    def report(self):
+        """
+        Prints a one-line summary of the limiter statistics.
+        """
+        stats = self.stats()
+        print(f"[*] Rate limiter: {stats['requests']} requests at {stats['requests_per_second']:.2f} req/s, "
+              f"waited {stats['total_wait']:.1f}s in total "
+              f"(avg {stats['average_wait']:.2f}s, max {stats['max_wait']:.2f}s).")
@@ -0,0 +1,256 @@
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import threading
+
+# Rows buffered in memory before they are written out
+DEFAULT_BATCH_SIZE = 1000
+
+# Maximum number of seconds a buffered row waits before it is written out
+DEFAULT_FLUSH_INTERVAL = 60.0
+
+def read_json(path, default=None):
+    """
+    Returns the JSON document stored in 'path', or 'default' if the file does not exist.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def write_json_atomic(path, data):
+    """
+    Writes 'data' as JSON so that 'path' always holds either the old or the new document:
+    the file is written and synced under a temporary name, then renamed over 'path'.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class CsvWriter:
+    """
+    Appends batches of records to a CSV file (same layout as pandas' to_csv with index=False).
+    The header is written when the file is new; appends keep the columns of the existing header.
+    'position' is the file size, so a batch half-written during a crash can be cut off by 'recover'.
+    """
+    suffix = ".csv"
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = self._read_header()
+
+    def _read_header(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+        with open(self.path, "r", newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), None)
+
+    def _encode(self, data):
+        return data
+
+    def write_batch(self, rows):
+        new_file = self.columns is None
+        if new_file:
+            self.columns = list(rows[0])
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.columns, restval="", lineterminator="\n")
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+        # One write per batch, synced to disk before the batch counts as saved
+        with open(self.path, "ab") as f:
+            f.write(self._encode(buffer.getvalue().encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def position(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def recover(self, position):
+        """
+        Cuts off anything written after the last checkpointed batch.
+        """
+        if self.position() > position:
+            with open(self.path, "r+b") as f:
+                f.truncate(position)
+            self.columns = self._read_header()
+            return True
+        return False
+
+class GzipCsvWriter(CsvWriter):
+    """
+    Compressed CSV: every batch is appended as a separate gzip member, which gzip readers
+    (and pandas.read_csv) decompress as one continuous stream.
+    """
+    suffix = ".csv.gz"
+
+    def _read_header(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return None
+        with gzip.open(self.path, "rt", newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), None)
+
+    def _encode(self, data):
+        return gzip.compress(data, compresslevel=6)
+
+class ParquetWriter:
+    """
+    Parquet dataset (requires 'pyarrow'): 'path' is a directory and every batch is written as one
+    row group in a new part file, readable with pandas.read_parquet(path).
+    A Parquet file cannot be appended to once its footer is written, so each batch gets its own
+    part; it is written under a temporary name and renamed, so a crash never leaves a broken part.
+    'position' is the number of part files.
+    """
+    suffix = ".parquet"
+
+    def __init__(self, path):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(name for name in os.listdir(self.path) if name.endswith(".parquet"))
+
+    def write_batch(self, rows):
+        table = self.pyarrow.Table.from_pylist(rows)
+        part_path = os.path.join(self.path, f"part-{len(self._parts()):06d}.parquet")
+        with open(part_path + ".tmp", "wb") as f:
+            self.parquet.write_table(table, f, row_group_size=len(rows))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(part_path + ".tmp", part_path)
+
+    def position(self):
+        return len(self._parts())
+
+    def recover(self, position):
+        removed = False
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.path, name))
+        for name in self._parts()[position:]:
+            os.remove(os.path.join(self.path, name))
+            removed = True
+        return removed
+
+WRITERS = {
+    "csv": CsvWriter,
+    "csv.gz": GzipCsvWriter,
+    "parquet": ParquetWriter,
+}
+
+class RecordSink:
+    """
+    Buffers scraped records in memory and writes them out in batches, instead of building a
+    DataFrame and appending to the CSV file for every page.
+    - output_format: 'csv', 'csv.gz' or 'parquet' (see WRITERS)
+    - batch_size: number of buffered rows (across all outputs) that triggers a flush
+    - flush_interval: seconds after which buffered rows are flushed on the next write
+    - checkpoint_path: JSON file recording what every output holds after the last flush
+      (None disables checkpoints)
+    - on_flush: callback run after every flush, once the rows are on disk (the scrapers commit
+      the dedup store there, so records still in the buffer are never marked as seen)
+    A crash loses at most the rows buffered since the last flush. When the sink is opened again,
+    data written to an output after its last checkpoint (a half-written batch) is cut off.
+    """
+    def __init__(self, output_format="csv", batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, checkpoint_path=None, on_flush=None):
+        if output_format not in WRITERS:
+            raise ValueError(f"Unknown output format '{output_format}'. Available: {', '.join(WRITERS)}")
+        self.writer_class = WRITERS[output_format]
+        self.suffix = self.writer_class.suffix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.checkpoint_path = checkpoint_path
+        self.on_flush = on_flush
+        self.checkpoint = {"outputs": {}}
+        if checkpoint_path:
+            self.checkpoint = read_json(checkpoint_path, self.checkpoint)
+
+        self.writers = {}
+        self.buffers = {}
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+
+        # Statistics
+        self.rows_written = 0
+        self.batches = 0
+        self.flush_seconds = 0.0
+
+    def output_path(self, base_path):
+        """
+        Returns the output path for 'base_path' (without extension) in the sink's format.
+        """
+        return base_path + self.suffix
+
+    def _writer(self, path):
+        if path not in self.writers:
+            writer = self.writer_class(path)
+            saved = self.checkpoint["outputs"].get(path)
+            if saved is not None and writer.recover(saved["position"]):
+                print(f"[!] Removed a partially written batch from {path}.")
+            self.writers[path] = writer
+        return self.writers[path]
+
+    def write(self, path, records):
+        """
+        Buffers 'records' for the output 'path'. Flushes when a threshold is reached.
+        Returns True if the buffer was flushed.
+        """
+        if not records:
+            return False
+        with self.lock:
+            self.buffers.setdefault(path, []).extend(records)
+            self.buffered += len(records)
+            if self.buffered >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+                return True
+        return False
+
+    def flush(self):
+        """
+        Writes every buffered row, records the checkpoint and runs 'on_flush'.
+        """
+        with self.lock:
+            if self.buffered:
+                start = time.perf_counter()
+                outputs = self.checkpoint["outputs"]
+                for path, rows in self.buffers.items():
+                    if not rows:
+                        continue
+                    writer = self._writer(path)
+                    writer.write_batch(rows)
+                    saved = outputs.setdefault(path, {"rows": 0})
+                    saved["rows"] += len(rows)
+                    saved["position"] = writer.position()
+                    self.rows_written += len(rows)
+                    self.batches += 1
+                if self.checkpoint_path:
+                    self.checkpoint["updated_at"] = time.time()
+                    write_json_atomic(self.checkpoint_path, self.checkpoint)
+                self.buffers = {}
+                self.buffered = 0
+                self.flush_seconds += time.perf_counter() - start
+                if self.on_flush is not None:
+                    self.on_flush()
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+    def report(self):
+        print(f"[*] Record sink: {self.rows_written} rows in {self.batches} batches, "
+              f"{self.flush_seconds:.2f}s spent writing.")
@@ -0,0 +1,275 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+# zstandard compresses HTML better and much faster than zlib; fall back to zlib if it is not installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Retention policy defaults
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_MAX_VERSIONS = 3
+
+class ResponseArchive:
+    """
+    Content-addressed archive of raw page responses.
+    - Bodies are compressed (zstd, or zlib if 'zstandard' is missing) and stored once per content
+      hash under 'archive_dir/blobs', so an unchanged page fetched again takes no extra space.
+    - Every fetch is recorded in an SQLite index keyed by URL + fetch time, together with the
+      ETag / Last-Modified validators used to build conditional requests on the next crawl.
+    - 'evict' applies the retention policy: at most 'max_versions' fetches per URL, nothing older
+      than 'max_age_days' (the latest fetch of a URL is always kept), and at most 'max_bytes' of
+      compressed bodies (oldest fetches are evicted first). Blobs no longer referenced are deleted.
+    The archive can be used from several threads.
+    """
+    def __init__(self, archive_dir, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS,
+                 max_versions=DEFAULT_MAX_VERSIONS, compression_level=10):
+        self.archive_dir = archive_dir
+        self.blob_dir = os.path.join(archive_dir, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.max_versions = max_versions
+        self.compression_level = compression_level
+        self.codec = "zstd" if zstandard is not None else "zlib"
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(archive_dir, "index.sqlite"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " id INTEGER PRIMARY KEY, url TEXT NOT NULL, fetched_at REAL NOT NULL, status INTEGER,"
+            " final_url TEXT, encoding TEXT, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_url ON responses (url, fetched_at)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " content_hash TEXT PRIMARY KEY, codec TEXT NOT NULL, size INTEGER, stored_size INTEGER)"
+        )
+        self.connection.commit()
+
+        # Statistics
+        self.stored = 0
+        self.not_modified = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blob_dir, content_hash[:2], content_hash)
+
+    def _compress(self, body):
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.compression_level).compress(body)
+        return zlib.compress(body, min(self.compression_level, 9))
+
+    def _decompress(self, data, codec):
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("The archive contains zstd blobs but 'zstandard' is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def _latest_row(self, url):
+        return self.connection.execute(
+            "SELECT final_url, encoding, etag, last_modified, content_hash FROM responses"
+            " WHERE url = ? ORDER BY fetched_at DESC LIMIT 1", (url,)
+        ).fetchone()
+
+    def conditional_headers(self, url):
+        """
+        Returns the If-None-Match / If-Modified-Since headers for the latest archived fetch of 'url'
+        (an empty dictionary if the URL was never archived or the server sent no validators).
+        """
+        with self.lock:
+            row = self._latest_row(url)
+        headers = {}
+        if row is None or not os.path.exists(self._blob_path(row[4])):
+            return headers
+        if row[2]:
+            headers["If-None-Match"] = row[2]
+        if row[3]:
+            headers["If-Modified-Since"] = row[3]
+        return headers
+
+    def store(self, url, body, encoding, final_url, headers, status=200):
+        """
+        Archives a downloaded response. 'headers' is the response header mapping.
+        Returns the content hash of the body.
+        """
+        content_hash = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(content_hash)
+        with self.lock:
+            known = self.connection.execute(
+                "SELECT 1 FROM blobs WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            if known is None or not os.path.exists(path):
+                data = self._compress(body)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temporary file first, so a crash never leaves a truncated blob
+                with open(path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO blobs (content_hash, codec, size, stored_size) VALUES (?, ?, ?, ?)",
+                    (content_hash, self.codec, len(body), len(data)),
+                )
+            self._record(url, status, final_url, encoding, headers.get("ETag"), headers.get("Last-Modified"),
+                         content_hash)
+            self.stored += 1
+            self.bytes_downloaded += len(body)
+        return content_hash
+
+    def _record(self, url, status, final_url, encoding, etag, last_modified, content_hash):
+        self.connection.execute(
+            "INSERT INTO responses (url, fetched_at, status, final_url, encoding, etag, last_modified, content_hash)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, time.time(), status, final_url, encoding, etag, last_modified, content_hash),
+        )
+        self.connection.commit()
+
+    def load_latest(self, url):
+        """
+        Returns the latest archived response of 'url' as a tuple (body, encoding, final_url),
+        or None if it is not in the archive.
+        """
+        with self.lock:
+            row = self._latest_row(url)
+            if row is None:
+                return None
+            final_url, encoding, _, _, content_hash = row
+            codec = self.connection.execute(
+                "SELECT codec FROM blobs WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        try:
+            with open(self._blob_path(content_hash), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        return self._decompress(data, codec[0] if codec else self.codec), encoding, final_url
+
+    def not_modified_response(self, url, headers):
+        """
+        Handles a 304 Not Modified answer: records the fetch (pointing at the archived body, with any
+        refreshed validators) and returns the archived response like 'load_latest'.
+        """
+        cached = self.load_latest(url)
+        if cached is None:
+            return None
+        body, encoding, final_url = cached
+        with self.lock:
+            etag, last_modified = self._latest_row(url)[2:4]
+            self._record(url, 304, final_url, encoding, headers.get("ETag") or etag,
+                         headers.get("Last-Modified") or last_modified, hashlib.sha256(body).hexdigest())
+            self.not_modified += 1
+            self.bytes_saved += len(body)
+        return cached
+
+    def iter_latest(self):
+        """
+        Yields (url, body, encoding, final_url) for the latest archived fetch of every URL,
+        e.g. to re-run the extraction after the selectors changed without crawling again.
+        """
+        with self.lock:
+            urls = [row[0] for row in self.connection.execute("SELECT DISTINCT url FROM responses ORDER BY url")]
+        for url in urls:
+            cached = self.load_latest(url)
+            if cached is not None:
+                yield (url,) + cached
+
+    def evict(self):
+        """
+        Applies the retention policy. Returns the number of fetch records removed.
+        """
+        with self.lock:
+            cursor = self.connection.cursor()
+            removed = 0
+
+            # Keep only the newest 'max_versions' fetches of every URL
+            if self.max_versions:
+                cursor.execute(
+                    "DELETE FROM responses WHERE id IN (SELECT id FROM ("
+                    " SELECT id, ROW_NUMBER() OVER (PARTITION BY url ORDER BY fetched_at DESC) AS version"
+                    " FROM responses) WHERE version > ?)", (self.max_versions,)
+                )
+                removed += cursor.rowcount
+
+            # Drop old fetches, but never the latest one of a URL
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                cursor.execute(
+                    "DELETE FROM responses WHERE fetched_at < ? AND fetched_at < ("
+                    " SELECT MAX(latest.fetched_at) FROM responses AS latest WHERE latest.url = responses.url)",
+                    (cutoff,)
+                )
+                removed += cursor.rowcount
+            removed_blobs = self._delete_unreferenced_blobs(cursor)
+
+            # Enforce the size cap by evicting the oldest fetches first
+            total = cursor.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+            while self.max_bytes and total > self.max_bytes:
+                oldest = cursor.execute(
+                    "SELECT id FROM responses ORDER BY fetched_at LIMIT 1000"
+                ).fetchall()
+                if not oldest:
+                    break
+                cursor.executemany("DELETE FROM responses WHERE id = ?", oldest)
+                removed += len(oldest)
+                removed_blobs += self._delete_unreferenced_blobs(cursor)
+                total = cursor.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+
+            self.connection.commit()
+        if removed:
+            print(f"[*] Response archive: evicted {removed} fetches and {removed_blobs} bodies.")
+        return removed
+
+    def _delete_unreferenced_blobs(self, cursor):
+        unreferenced = cursor.execute(
+            "SELECT content_hash FROM blobs WHERE content_hash NOT IN (SELECT content_hash FROM responses)"
+        ).fetchall()
+        for (content_hash,) in unreferenced:
+            try:
+                os.remove(self._blob_path(content_hash))
+            except FileNotFoundError:
+                pass
+        cursor.executemany("DELETE FROM blobs WHERE content_hash = ?", unreferenced)
+        return len(unreferenced)
+
+    def stats(self):
+        """
+        Returns the archive counters of this run and its size on disk.
+        """
+        with self.lock:
+            fetches, urls = self.connection.execute("SELECT COUNT(*), COUNT(DISTINCT url) FROM responses").fetchone()
+            blobs, size, stored_size = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs"
+            ).fetchone()
+        return {
+            "stored": self.stored,
+            "not_modified": self.not_modified,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved,
+            "fetches": fetches,
+            "urls": urls,
+            "blobs": blobs,
+            "size": size,
+            "stored_size": stored_size,
+        }
+
+    def report(self):
+        stats = self.stats()
+        ratio = stats["size"] / stats["stored_size"] if stats["stored_size"] else 0.0
+        print(f"[*] Response archive: {stats['stored']} pages downloaded, {stats['not_modified']} served "
+              f"from the archive ({stats['bytes_saved'] / (1024 * 1024):.1f} MB not downloaded).")
+        print(f"    {stats['urls']} URLs, {stats['fetches']} fetches, {stats['blobs']} bodies, "
+              f"{stats['stored_size'] / (1024 * 1024):.1f} MB on disk (compression {ratio:.1f}x, {self.codec}).")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
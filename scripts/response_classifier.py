@@ -0,0 +1,85 @@
+from urllib.parse import urlsplit, parse_qs
+
+# Response classes
+LISTINGS = "listings"
+EMPTY = "empty"
+CAPTCHA = "captcha"
+BLOCK = "block"
+REDIRECT_LOOP = "redirect-loop"
+RESPONSE_CLASSES = [LISTINGS, EMPTY, CAPTCHA, BLOCK, REDIRECT_LOOP]
+
+# Status codes returned by the anti-bot protection instead of a page
+BLOCK_STATUSES = {403, 429}
+
+# Markers of challenge pages. A bare "captcha" is not enough: every normal page has a
+# '.grecaptcha-badge' rule in its inline CSS.
+CAPTCHA_MARKERS = [b"captcha-delivery.com", b"g-recaptcha", b"h-captcha", b"cf-turnstile",
+                   b"/cdn-cgi/challenge-platform"]
+
+# Markers of "too many requests" pages (the body is not lowercased - that would copy the whole page)
+BLOCK_MARKERS = [b"zbyt wiele zapyta", b"Zbyt wiele zapyta", b"ZBYT WIELE ZAPYTA",
+                 b"too many requests", b"Too many requests", b"Too Many Requests"]
+
+# Spellings of the bare word, for pages without listings
+CAPTCHA_WORDS = [b"captcha", b"Captcha", b"CAPTCHA"]
+
+# Markers of a results page with at least one listing: a listing card in the HTML,
+# or a non-empty list of results in the embedded JSON
+LISTING_MARKERS = [b'<article data-id="', b'\\"edges\\":[{', b'"edges":[{']
+
+def page_number(url):
+    """
+    Returns the 'page' query parameter of a URL (1 if it is missing).
+    """
+    values = parse_qs(urlsplit(url).query).get("page")
+    try:
+        return int(values[0]) if values else 1
+    except ValueError:
+        return 1
+
+def classify_response(body, status=200, requested_url=None, final_url=None):
+    """
+    Labels a raw response before any HTML is parsed, using only substring searches on the bytes:
+    - 'redirect-loop': a page past the first was redirected to another page of the search
+    - 'captcha' / 'block': anti-bot challenge or "too many requests" page (or status 403 / 429)
+    - 'listings': the page lists offers - the only class worth parsing
+    - 'empty': a results page without any offer
+    """
+    if requested_url is not None and final_url is not None:
+        requested_page = page_number(requested_url)
+        if requested_page > 1 and page_number(final_url) != requested_page:
+            return REDIRECT_LOOP
+
+    if status in BLOCK_STATUSES:
+        return CAPTCHA if any(marker in body for marker in CAPTCHA_MARKERS) else BLOCK
+
+    # Checked first: on a results page the first listing card is found early, so the full-body
+    # searches below only run on the (small) pages without listings
+    if any(marker in body for marker in LISTING_MARKERS):
+        return LISTINGS
+
+    if any(marker in body for marker in CAPTCHA_MARKERS):
+        return CAPTCHA
+    if any(marker in body for marker in BLOCK_MARKERS):
+        return BLOCK
+    # A page without listings that mentions a captcha is most likely a challenge page
+    if any(word in body for word in CAPTCHA_WORDS):
+        return CAPTCHA
+    return EMPTY
+
+class ResponseClassifier:
+    """
+    'classify_response' with a counter per response class.
+    """
+    def __init__(self):
+        self.counts = {label: 0 for label in RESPONSE_CLASSES}
+
+    def classify(self, body, status=200, requested_url=None, final_url=None):
+        label = classify_response(body, status, requested_url, final_url)
+        self.counts[label] += 1
+        return label
+
+    def report(self):
+        total = sum(self.counts.values())
+        parts = ", ".join(f"{self.counts[label]} {label}" for label in RESPONSE_CLASSES)
+        print(f"[*] Responses: {total} classified - {parts}.")
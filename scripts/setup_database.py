@@ -1,22 +1,12 @@
-import pyodbc
-from scripts.connect_sql import get_connection  # Import the SQL Server connection
+from scripts.db_backends import get_backend  # SQL Server, SQLite or DuckDB (DB_BACKEND)
 
-# Read the SQL script from the file
-with open("sql/create_tables.sql", "r") as file:
-    sql_script = file.read()
+# Create the 'cars' and 'cars_staging' tables in the configured database
+backend = get_backend()
+with backend.connection() as conn:
+    backend.create_schema(conn)
+print(f"✅ Tables have been created in {backend.name}!")
 
-# Create a cursor object to interact with the SQL Server
-conn = get_connection()
-cursor = conn.cursor()
-
-# Execute the SQL script
-for statement in sql_script.split("GO"):  # SQL Server uses "GO" as a batch separator
-    if statement.strip():
-        cursor.execute(statement)
-
-conn.commit()
-print("✅ Tables have been created in SQL Server!")
-
-conn.close()
+backend.close()
 
 # Run this script with: python scripts/setup_database.py
+# (set DB_BACKEND=sqlite or DB_BACKEND=duckdb to create a local database file instead)
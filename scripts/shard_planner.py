@@ -0,0 +1,317 @@
+import json
+import math
+import asyncio
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import httpx
+from scripts.rate_limiter import RateLimiter
+from scripts.next_data import find_next_data, find_advert_search
+from scripts.probe_cache import ProbeCache, last_page_search
+from scripts.response_classifier import LISTINGS, EMPTY, CAPTCHA, BLOCK, classify_response
+from scripts.listings_scraping_with_BeautifulSoup import build_headers, rotate_user_agent
+
+# Search covering every listing the crawler should collect (undamaged passenger cars)
+ROOT_SEARCH_URL = ('https://www.otomoto.pl/osobowe?search%5Bfilter_enum_damaged%5D=0'
+                   '&search%5Border%5D=relevance_web&search%5Badvanced_search_expanded%5D=true')
+
+# Otomoto does not show more than this many result pages for a single search
+PAGE_CAP = 500
+
+# Results per page, used when the page does not report it
+DEFAULT_PAGE_SIZE = 32
+
+# Maximum number of count probes in flight
+DEFAULT_PROBE_CONCURRENCY = 4
+
+# Page counts of probed searches, reused by later runs
+DEFAULT_CACHE_PATH = "data/probe_cache.json"
+
+class RangeDimension:
+    """
+    Numeric filter split into halves, e.g. year -> [from, mid] and [mid + 1, to].
+    Bounds are inclusive; None means the side is open, so the outermost shards also cover values
+    outside 'low'..'high'. A range not wider than 'min_width' is not split any further.
+    """
+    def __init__(self, name, param, low, high, min_width):
+        self.name = name
+        self.param = param
+        self.low = low
+        self.high = high
+        self.min_width = min_width
+
+    def initial(self):
+        return (None, None)
+
+    def split(self, bounds):
+        low = self.low if bounds[0] is None else bounds[0]
+        high = self.high if bounds[1] is None else bounds[1]
+        if high - low <= self.min_width:
+            return None
+        middle = (low + high) // 2
+        return [(bounds[0], middle), (middle + 1, bounds[1])]
+
+    def params(self, bounds):
+        params = {}
+        if bounds[0] is not None:
+            params[f"search[{self.param}:from]"] = str(bounds[0])
+        if bounds[1] is not None:
+            params[f"search[{self.param}:to]"] = str(bounds[1])
+        return params
+
+    def describe(self, bounds):
+        return f"{self.name} {'' if bounds[0] is None else bounds[0]}-{'' if bounds[1] is None else bounds[1]}"
+
+class EnumDimension:
+    """
+    Filter with a fixed list of values (e.g. gearbox), split into one shard per value.
+    """
+    def __init__(self, name, param, values):
+        self.name = name
+        self.param = param
+        self.values = values
+
+    def initial(self):
+        return None
+
+    def split(self, value):
+        if value is not None:
+            return None
+        return list(self.values)
+
+    def params(self, value):
+        return {} if value is None else {f"search[{self.param}]": value}
+
+    def describe(self, value):
+        return f"{self.name} {value}"
+
+# Dimensions in the order they are split: a shard over the page cap is split along the first
+# dimension that can still be narrowed
+DIMENSIONS = [
+    RangeDimension("year", "filter_float_year", 1950, datetime.now().year, 0),
+    RangeDimension("price", "filter_float_price", 0, 2_000_000, 1000),
+    RangeDimension("mileage", "filter_float_mileage", 0, 1_000_000, 1000),
+    EnumDimension("gearbox", "filter_enum_gearbox", ["manual", "automatic"]),
+]
+
+class ShardPlan:
+    """
+    One leaf of the search partition: the filter value of every dimension and its probed size.
+    """
+    def __init__(self, root_url, values, total_count=None, pages=None):
+        self.root_url = root_url
+        self.values = values
+        self.total_count = total_count
+        self.pages = pages
+
+    @property
+    def url(self):
+        parts = urlsplit(self.root_url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        for dimension, value in zip(DIMENSIONS, self.values):
+            query.extend(dimension.params(value).items())
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def describe(self):
+        parts = [dimension.describe(value) for dimension, value in zip(DIMENSIONS, self.values)
+                 if value != dimension.initial()]
+        return ", ".join(parts) or "all listings"
+
+    def children(self):
+        """
+        Splits the shard along the first dimension that can still be narrowed.
+        Returns None if no dimension can be split.
+        """
+        for index, dimension in enumerate(DIMENSIONS):
+            parts = dimension.split(self.values[index])
+            if parts:
+                return [ShardPlan(self.root_url, self.values[:index] + [part] + self.values[index + 1:])
+                        for part in parts]
+        return None
+
+    def to_dict(self):
+        return {"url": self.url, "total_count": self.total_count, "pages": self.pages,
+                "filters": self.describe()}
+
+def read_result_count(html):
+    """
+    Returns (total_count, page_size) from the search results payload of a page, or None.
+    """
+    next_data = find_next_data(html)
+    advert_search = find_advert_search(next_data) if next_data is not None else None
+    if advert_search is None or advert_search.get("totalCount") is None:
+        return None
+    page_size = (advert_search.get("pageInfo") or {}).get("pageSize") or DEFAULT_PAGE_SIZE
+    return int(advert_search["totalCount"]), int(page_size)
+
+async def fetch_search_page(client, url, semaphore, rate_limiter):
+    """
+    Downloads a search page through the shared limits. Returns the response, or None on failure.
+    """
+    async with semaphore:
+        await rate_limiter.acquire_async()
+        try:
+            return await client.get(url, headers=build_headers(rotate_user_agent()), timeout=10)
+        except httpx.HTTPError as e:
+            print(f"[!] Error during probe {url}: {e}")
+            return None
+
+async def page_has_listings(client, url, page_number, semaphore, rate_limiter):
+    resp = await fetch_search_page(client, f"{url}&page={page_number}", semaphore, rate_limiter)
+    if resp is None or resp.status_code != 200:
+        return False
+    # Pages past the end of the results redirect to another page of the search
+    if page_number > 1 and f"page={page_number}" not in str(resp.url):
+        return False
+    label = classify_response(resp.content, resp.status_code)
+    if label in (CAPTCHA, BLOCK):
+        print(f"[!] {label.upper()} detected while searching for the last page of {url}")
+    return label == LISTINGS
+
+async def find_last_page_async(client, url, semaphore, rate_limiter, page_cap, known):
+    """
+    Runs 'last_page_search' over HTTP. 'known' maps page numbers already checked to their result.
+    Returns (last_page, requests).
+    """
+    search = last_page_search(page_cap)
+    requests = 0
+    try:
+        page_number = next(search)
+        while True:
+            if page_number in known:
+                has_listings = known[page_number]
+            else:
+                has_listings = await page_has_listings(client, url, page_number, semaphore, rate_limiter)
+                requests += 1
+            page_number = search.send(has_listings)
+    except StopIteration as stop:
+        return stop.value, requests
+
+async def probe_count(client, url, semaphore, rate_limiter, page_cap=PAGE_CAP, retries=2):
+    """
+    Downloads the first page of a search and reads its result count. If the page carries no
+    result count, the last page is found by exponential + binary search instead.
+    The first page is classified before it is read: captcha / block pages are retried, and a
+    search is only reported as empty (0 pages) when its first page is classified 'empty'.
+    Returns a tuple: (result, requests)
+       - result -> (total_count, pages), total_count being None if only the pages are known;
+         None if the search could not be probed
+       - requests -> number of requests sent
+    """
+    requests = 0
+    for attempt in range(retries + 1):
+        resp = await fetch_search_page(client, url, semaphore, rate_limiter)
+        requests += 1
+        if resp is not None and resp.status_code == 200:
+            label = classify_response(resp.content, resp.status_code)
+            if label in (LISTINGS, EMPTY):
+                count = read_result_count(resp.content)
+                # A zero count is only trusted on a page without listings
+                if count is not None and (count[0] > 0 or label == EMPTY):
+                    total_count, page_size = count
+                    return (total_count, math.ceil(total_count / page_size)), requests
+
+                last_page, search_requests = await find_last_page_async(
+                    client, url, semaphore, rate_limiter, page_cap, known={1: label == LISTINGS})
+                return (None, last_page), requests + search_requests
+            print(f"[!] {label.upper()} detected while probing {url} (attempt {attempt + 1}).")
+        await asyncio.sleep(5 * (attempt + 1))
+    return None, requests
+
+async def count_pages(client, shard, semaphore, rate_limiter, page_cap, cache):
+    """
+    Returns (result, requests) like 'probe_count', answering from 'cache' when it holds a fresh entry.
+    """
+    if cache is not None:
+        entry = cache.get(shard.url)
+        if entry is not None:
+            return (entry["total_count"], entry["pages"]), 0
+    result, requests = await probe_count(client, shard.url, semaphore, rate_limiter, page_cap)
+    if result is not None and cache is not None:
+        cache.put(shard.url, result[0], result[1], requests)
+    return result, requests
+
+async def plan_shards_async(root_url=ROOT_SEARCH_URL, page_cap=PAGE_CAP, concurrency=DEFAULT_PROBE_CONCURRENCY,
+                            rate_limiter=None, cache=None):
+    """
+    Partitions the search 'root_url' until every shard fits in 'page_cap' pages.
+    Shards over the cap are split by year, then price, then mileage, then gearbox; every level of
+    the partition is probed concurrently. With a ProbeCache, searches probed within its TTL are
+    not probed again, so an unchanged plan is rebuilt without any request.
+    Only shards whose probe found an empty results page are left out. A shard that could not be
+    probed (captcha, block, request errors) is kept with 'page_cap' pages and reported as unplanned.
+    Returns the list of leaf ShardPlans.
+    """
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    leaves = []
+    unplanned = []
+    empty = 0
+    level = [ShardPlan(root_url, [dimension.initial() for dimension in DIMENSIONS])]
+    probes = 0
+    async with httpx.AsyncClient(follow_redirects=True) as client:
+        while level:
+            results = await asyncio.gather(*(count_pages(client, shard, semaphore, rate_limiter, page_cap, cache)
+                                             for shard in level))
+            next_level = []
+            for shard, (result, requests) in zip(level, results):
+                probes += requests
+                if result is None:
+                    print(f"[!] Could not read the result count of {shard.describe()} - keeping it as one "
+                          f"shard of up to {page_cap} pages.")
+                    shard.pages = page_cap
+                    unplanned.append(shard)
+                    leaves.append(shard)
+                    continue
+                shard.total_count, shard.pages = result
+                if shard.pages == 0:
+                    # The probe classified the first page as empty
+                    empty += 1
+                    continue
+                if shard.pages <= page_cap:
+                    leaves.append(shard)
+                    continue
+                children = shard.children()
+                if children is None:
+                    print(f"[!] {shard.describe()} has over {page_cap} pages and cannot be split further - "
+                          f"only the first {page_cap} pages will be scraped.")
+                    leaves.append(shard)
+                    continue
+                next_level.extend(children)
+            level = next_level
+
+    if cache is not None:
+        cache.save()
+        cache.report()
+    total = sum(shard.total_count or 0 for shard in leaves)
+    print(f"[*] Shard plan: {len(leaves)} shards covering {total} listings ({probes} probe requests), "
+          f"{empty} empty shards left out.")
+    if unplanned:
+        print(f"[!] {len(unplanned)} shards could not be probed and were kept unsplit:")
+        for shard in unplanned:
+            print(f"    {shard.describe()}")
+    return leaves
+
+def plan_shards(root_url=ROOT_SEARCH_URL, page_cap=PAGE_CAP, **options):
+    """
+    Synchronous entry point for 'plan_shards_async'.
+    """
+    return asyncio.run(plan_shards_async(root_url, page_cap, **options))
+
+def save_plan(shards, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([shard.to_dict() for shard in shards], f, ensure_ascii=False, indent=2)
+
+def load_plan_urls(path):
+    """
+    Returns the base URLs of a saved shard plan, ready for 'scrape_multiple_links'.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [shard["url"] for shard in json.load(f)]
+
+if __name__ == "__main__":
+    shards = plan_shards(cache=ProbeCache(DEFAULT_CACHE_PATH))
+    save_plan(shards, "data/shard_plan.json")
+    for shard in shards:
+        print(f"{shard.pages:>4} pages  {shard.describe()}")
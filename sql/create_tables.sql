@@ -27,3 +27,45 @@ BEGIN
     );
 END;
 GO
+
+-- Remove duplicate listings left by earlier loads (the most recent row of every Otomoto_ID is kept),
+-- so the unique index below can be created
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'UX_cars_Otomoto_ID' AND object_id = OBJECT_ID('cars'))
+BEGIN
+    WITH ranked AS (
+        SELECT ROW_NUMBER() OVER (PARTITION BY Otomoto_ID ORDER BY Scraping_Date DESC, id DESC) AS row_rank
+        FROM cars
+        WHERE Otomoto_ID IS NOT NULL
+    )
+    DELETE FROM ranked WHERE row_rank > 1;
+
+    CREATE UNIQUE INDEX UX_cars_Otomoto_ID ON cars (Otomoto_ID) WHERE Otomoto_ID IS NOT NULL;
+END;
+GO
+
+-- Staging table of the loader: every load is bulk-inserted here and merged into 'cars' on Otomoto_ID
+IF NOT EXISTS (SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = 'cars_staging')
+BEGIN
+    CREATE TABLE cars_staging (
+        Make VARCHAR(100),
+        Model VARCHAR(100),
+        Engine_capacity FLOAT,
+        Power_HP FLOAT,
+        Mileage_in_km FLOAT,
+        Fuel_Type VARCHAR(100),
+        Gearbox VARCHAR(100),
+        Year INT,
+        City VARCHAR(255),
+        Province VARCHAR(255),
+        Seller_Type VARCHAR(100),
+        Price FLOAT,
+        Currency VARCHAR(10),
+        Otomoto_ID BIGINT,
+        Otomoto_Indicator VARCHAR(100),
+        Title VARCHAR(255),
+        Link VARCHAR(255),
+        Description VARCHAR(MAX),
+        Scraping_Date DATETIME
+    );
+END;
+GO